@@ -1,10 +1,13 @@
 import tkinter as tk
-from tkinter import messagebox
+from tkinter import filedialog, messagebox
 import csv
 
 class AddVoterPage(tk.Toplevel):
     """Represents the Add Voter Page in the admin app."""
 
+    # milliseconds between checks for the admin app's near-duplicate index
+    INDEX_POLL_INTERVAL = 250
+
     def __init__(self, admin_app):
         """Initializes the AddVoterPage.
 
@@ -14,6 +17,14 @@ class AddVoterPage(tk.Toplevel):
         super().__init__()
 
         self.admin_app = admin_app
+        # edits since the page opened as (added, name, voter_id), and how many
+        # of them are in the admin app's near-duplicate index and the saved roll
+        self.edits = []
+        self.applied = 0
+        self.saved = 0
+        self.index_ready = False
+        self.index_job = None
+        self.voter_ids = set()
         self.title("Add Voter Page")
         
         width = 755
@@ -57,6 +68,10 @@ class AddVoterPage(tk.Toplevel):
         self.delete_voter_button = tk.Button(self, text="Delete Voter", command=self.delete_voter)
         self.delete_voter_button.pack(pady=(0, 10))
 
+        # import voters
+        self.import_voters_button = tk.Button(self, text="Import Voters", command=self.import_voters)
+        self.import_voters_button.pack(pady=(0, 10))
+
         # save voter list
         self.save_list_button = tk.Button(self, text="Save Voter List", command=self.save_voter_list)
         self.save_list_button.pack(pady=(0, 10))
@@ -73,6 +88,9 @@ class AddVoterPage(tk.Toplevel):
         self.entry_new_name.bind("<FocusIn>", lambda event: self.clear_status())
         self.entry_new_id.bind("<FocusIn>", lambda event: self.clear_status())
 
+        # flag probable duplicates while typing
+        self.entry_new_name.bind("<KeyRelease>", lambda event: self.check_near_duplicates())
+
         # validate voter ID
         validate_id = self.register(self.validate_voter_id)
         self.entry_new_id.config(validate="key", validatecommand=(validate_id, "%P"))
@@ -98,11 +116,17 @@ class AddVoterPage(tk.Toplevel):
 
         if name and voter_id:
             if not self.is_duplicate_voter_id(voter_id):
+                warning = self.duplicate_warning(name)
                 voter_info = f"{name} - {voter_id}"
                 self.voter_listbox.insert(tk.END, voter_info)
+                self.voter_ids.add(voter_id)
+                self.record_edit(True, name, voter_id)
                 self.entry_new_name.delete(0, tk.END)
                 self.entry_new_id.delete(0, tk.END)
-                self.display_status(f"Voter {name} added successfully!", "green")
+                if warning:
+                    self.display_status(f"Voter {name} added, {warning}.", "orange")
+                else:
+                    self.display_status(f"Voter {name} added successfully!", "green")
             else:
                 self.display_status("Voter ID must be unique.", "red")
         else:
@@ -117,16 +141,132 @@ class AddVoterPage(tk.Toplevel):
         :return: True if the voter ID is a duplicate, False if not.
         :rtype: bool
         """
-        return any(voter_id in item for item in self.voter_listbox.get(0, tk.END))
-    
+        return voter_id in self.voter_ids
+
+    def check_near_duplicates(self):
+        """Warns while typing if the name is close to a registered voter."""
+        name = self.entry_new_name.get()
+        warning = self.duplicate_warning(name) if name else ""
+        if warning:
+            self.display_status(f"Voter {name}: {warning}.", "orange")
+        else:
+            self.clear_status()
+
+    def duplicate_warning(self, name):
+        """Describes the registered voters a name may duplicate.
+
+        A lookup that hit the index's bounds, or one made before the index
+        is built, is reported rather than passed as no duplicates.
+
+        :param name: The name to look up.
+        :type name: str
+
+        :return: The warning, or "" if the name has no near duplicates.
+        :rtype: str
+        """
+        if not self.index_ready:
+            return "duplicates not checked, voters are still being indexed"
+        matches, complete = self.admin_app.duplicate_index.find(name)
+        warnings = []
+        if matches:
+            warnings.append(f"possible duplicate of {self.describe_matches(matches)}")
+        if not complete:
+            warnings.append("too many similar names to compare them all, check by hand")
+        return ", ".join(warnings)
+
+    def record_edit(self, added, name, voter_id):
+        """Keeps an added or deleted voter for the near-duplicate index.
+
+        :param added: True for an added voter, False for a deleted one.
+        :type added: bool
+
+        :param name: The voter's name.
+        :type name: str
+
+        :param voter_id: The voter's ID.
+        :type voter_id: str
+        """
+        self.edits.append((added, name, voter_id))
+        if self.index_ready:
+            self.apply_edits()
+
+    def apply_edits(self):
+        """Brings the admin app's near-duplicate index up to date with this
+        page's edits."""
+        index = self.admin_app.duplicate_index
+        for added, name, voter_id in self.edits[self.applied:]:
+            if added:
+                index.add(name, voter_id)
+            else:
+                index.remove(name, voter_id)
+        self.applied = len(self.edits)
+
+    def wait_for_duplicate_index(self):
+        """Polls until the admin app's near-duplicate index is built, then
+        applies this page's edits to it."""
+        self.index_job = None
+        if self.admin_app.duplicate_index is None:
+            self.admin_app.build_duplicate_index()
+            self.index_job = self.after(self.INDEX_POLL_INTERVAL, self.wait_for_duplicate_index)
+            return
+        self.index_ready = True
+        self.apply_edits()
+        self.check_near_duplicates()
+
+    def describe_matches(self, matches):
+        """Formats near-duplicate matches for the status label.
+
+        :param matches: (similarity, name, voter_id) tuples.
+        :type matches: list
+
+        :return: The matches as "name (ID)" separated by commas.
+        :rtype: str
+        """
+        return ", ".join(f"{name} ({voter_id})" for _, name, voter_id in matches)
+
+    def import_voters(self):
+        """Adds voters from a CSV file, flagging probable duplicates."""
+        file_path = filedialog.askopenfilename(parent=self, filetypes=[("CSV files", "*.csv")])
+        if not file_path:
+            return
+        added = 0
+        skipped = 0
+        flagged = []
+        checked = self.index_ready
+        with open(file_path, 'r', newline='') as file:
+            reader = csv.reader(file)
+            next(reader, None)
+            for row in reader:
+                if len(row) < 2 or not row[0] or not row[1].isdigit() or self.is_duplicate_voter_id(row[1]):
+                    skipped += 1
+                    continue
+                name, voter_id = row[:2]
+                warning = self.duplicate_warning(name) if checked else ""
+                if warning:
+                    flagged.append(f"{name} ({voter_id}): {warning}")
+                self.voter_listbox.insert(tk.END, f"{name} - {voter_id}")
+                self.voter_ids.add(voter_id)
+                self.record_edit(True, name, voter_id)
+                added += 1
+        if checked:
+            self.display_status(f"Imported {added} voters, skipped {skipped}, {len(flagged)} possible duplicates.",
+                                "orange" if flagged else "green")
+        else:
+            self.display_status(f"Imported {added} voters, skipped {skipped}, duplicates not checked, "
+                                f"voters are still being indexed.", "orange")
+        if flagged:
+            messagebox.showwarning("Possible Duplicates", "\n".join(flagged[:20]), parent=self)
+
     def delete_voter(self):
         """Deletes the selected voter from the list."""
         selected_index = self.voter_listbox.curselection()
         if selected_index:
             voter_info = self.voter_listbox.get(selected_index)
             voter_id = voter_info.split(" - ")[1]
-            if voter_id in [item.split(" - ")[1] for item in self.voter_listbox.get(0, tk.END)]:
+            if voter_id in self.voter_ids:
                 self.voter_listbox.delete(selected_index)
+                self.voter_ids.discard(voter_id)
+                self.record_edit(False, voter_info.split(" - ")[0], voter_id)
                 self.display_status(f"Voter {voter_info} deleted successfully!", "green")
             else:
                 self.display_status(f"{voter_info} not found for deletion.", "red")
@@ -134,39 +274,47 @@ class AddVoterPage(tk.Toplevel):
             self.display_status("No voter selected for deletion.", "red")
 
     def save_voter_list(self):
-        """Saves the current voter list to a CSV file."""
+        """Saves the current voter list to the election snapshot and exports the CSV file."""
         try:
-            current_voters = [item.split(" - ") for item in self.voter_listbox.get(0, tk.END)]
-            with open('voters.csv', 'w', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow(['Name', 'VoterID'])
-                for name, voter_id in current_voters:
-                    writer.writerow([name, voter_id])
+            current_voters = [item.rsplit(" - ", 1) for item in self.voter_listbox.get(0, tk.END)]
+            self.admin_app.snapshot.with_voters(current_voters).checkpoint(self.admin_app.directory)
+            if not self.index_ready:
+                # the index being built is of the old roll, the next one includes these edits
+                self.admin_app.drop_duplicate_index()
+                self.applied = len(self.edits)
+            self.saved = len(self.edits)
             self.display_status("Voter list saved successfully!", "green")
         except PermissionError:
             self.display_status("Must close open list file to save!", "red")
 
     def load_voters(self):
-        """Loads the voter list from a CSV file."""
-        try:
-            with open('voters.csv', 'r') as file:
-                reader = csv.reader(file)
-                next(reader, None)
-                voters_data = []
-                for row in reader:
-                    if len(row) >= 2:
-                        voter_info = f"{row[0]} - {row[1]}"
-                        voters_data.append(voter_info)
-                for voter_info in voters_data:
-                    self.voter_listbox.insert(tk.END, voter_info)
-        except FileNotFoundError:
-            pass
+        """Loads the voter list from the election snapshot."""
+        voter_rows = self.admin_app.snapshot.voters()
+        self.voter_listbox.insert(tk.END, *(f"{name} - {voter_id}" for name, voter_id in voter_rows))
+        self.voter_ids = {voter_id for _, voter_id in voter_rows}
+        self.wait_for_duplicate_index()
 
     def return_to_admin_page(self):
         """Returns to the Admin Page."""
         self.destroy()
         self.admin_app.root.deiconify()
 
+    def destroy(self):
+        """Stops waiting for the near-duplicate index and takes unsaved edits
+        back out of it before closing the page."""
+        if self.index_job is not None:
+            self.after_cancel(self.index_job)
+            self.index_job = None
+        if self.index_ready:
+            index = self.admin_app.duplicate_index
+            for added, name, voter_id in reversed(self.edits[self.saved:self.applied]):
+                if added:
+                    index.remove(name, voter_id)
+                else:
+                    index.add(name, voter_id)
+            self.applied = self.saved
+        super().destroy()
+
     def display_status(self, message, color):
         """Displays a status message.
 
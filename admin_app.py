@@ -1,12 +1,21 @@
 import tkinter as tk
 from tkinter import ttk
-import csv
 from collections import Counter
+import threading
+import time
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from add_voter_page import AddVoterPage
 from election import Election
-import json
+from election_host import read_positions
+from ballot_store import ballot_log_paths
+from turnout import TurnoutAggregator
+from projection import BallotSampler, Projection
+from candidate_search import CandidateIndex, show_matches
+from snapshot import ElectionSnapshot
+from replication import read_replica_state
+from candidate_rules import CandidateRules, verify_results
+from voter_roll import NearDuplicateIndex
 
 class Candidate:
     """Represents a candidate in the election."""
@@ -26,15 +35,24 @@ class Candidate:
 class AdminApp(tk.Tk):
     """Admin user interface."""
     
-    def __init__(self, admin_user):
+    def __init__(self, admin_user, replica_directory=None, directory='.'):
         """Initializes the AdminApp.
 
         :param admin_user: The admin user for the app.
         :type admin_user: Admin
+
+        :param replica_directory: If given, results, projections and turnout
+            are read from this replica instead of the kiosks' files.
+        :type replica_directory: str
+
+        :param directory: Directory holding the election files.
+        :type directory: str
         """
         super().__init__()
 
         self.admin_user = admin_user
+        self.replica_directory = replica_directory
+        self.directory = directory
         self.title(f"Admin {self.admin_user.login_id}")
         self.root = tk.Tk()
         self.root.title("Admin Page")
@@ -47,28 +65,46 @@ class AdminApp(tk.Tk):
         y = (self.root.winfo_screenheight() - height) // 2
 
         self.root.geometry(f"{width}x{height}+{x}+{y}")
-        self.election = Election()
+        self.positions = read_positions(directory)
+        self.election = Election(self.positions, directory)
+        self.snapshot = ElectionSnapshot.open(directory)
+        self.candidate_rules = CandidateRules.load(directory)
+        self.turnout = TurnoutAggregator()
 
         frame = tk.Frame(self.root)
         frame.grid(row=0, column=0, padx=10, pady=10)
 
         # candidates elements
-        self.positions = ["President", "Vice-President", "Secretary", "Treasurer"]
         self.candidates_listboxes = {}
+        self.search_entries = {}
+        self.shown_candidates = {}
 
         for i, position in enumerate(self.positions):
-            label = tk.Label(frame, text=f"{position} List:")
-            label.grid(row=0, column=i)
+            header = tk.Frame(frame)
+            header.grid(row=0, column=i)
+            label = tk.Label(header, text=f"{position} List:")
+            label.pack()
+            search_entry = tk.Entry(header, width=20)
+            search_entry.pack()
+            search_entry.bind("<KeyRelease>", lambda event: self.refresh_candidates_listboxes())
+            self.search_entries[position] = search_entry
 
             listbox_width = 30
             listbox_height = 10
             candidates_listbox = tk.Listbox(frame, selectmode=tk.SINGLE, width=listbox_width, height=listbox_height)
             candidates_listbox.grid(row=1, column=i)
             self.candidates_listboxes[position] = candidates_listbox
+            self.shown_candidates[position] = []
 
         self.candidates_dict = {}
+        self.candidate_index = CandidateIndex()
         self.load_candidates() 
 
+        # near-duplicate index of the saved voter roll, built once in the background
+        self.duplicate_index = None
+        self.duplicate_building = False
+        self.duplicate_generation = 0
+
         # candidate
         self.label_name = tk.Label(frame, text="Candidate Name:")
         self.label_name.grid(row=2, column=0, pady=(10, 0), sticky='e', columnspan=2) 
@@ -79,7 +115,7 @@ class AdminApp(tk.Tk):
         self.label_position = tk.Label(frame, text="Candidate Position:")
         self.label_position.grid(row=3, column=0, pady=(10, 0), sticky='e', columnspan=2) 
 
-        position_options = ["", "President", "Vice-President", "Secretary", "Treasurer"]
+        position_options = [""] + self.positions
         self.selected_position = tk.StringVar(frame)
         self.selected_position.set(position_options[0])
         self.position_dropdown = tk.OptionMenu(frame, self.selected_position, *position_options)
@@ -93,6 +129,12 @@ class AdminApp(tk.Tk):
         self.delete_candidate_button = tk.Button(frame, text="Delete Candidate", command=self.delete_candidate)
         self.delete_candidate_button.grid(row=5, column=0, columnspan=4, pady=(10, 0))
 
+        # rename and merge candidates, keeping their votes
+        self.rename_candidate_button = tk.Button(frame, text="Rename Candidate", command=self.rename_candidate)
+        self.rename_candidate_button.grid(row=6, column=0, columnspan=2, pady=(10, 0))
+        self.merge_candidate_button = tk.Button(frame, text="Merge Into Entered", command=self.merge_candidate)
+        self.merge_candidate_button.grid(row=6, column=2, columnspan=2, pady=(10, 0))
+
         # display messages
         self.message_label = tk.Label(self.root, text="", fg="green")
         self.message_label.grid(row=7, column=0, columnspan=4)
@@ -108,6 +150,15 @@ class AdminApp(tk.Tk):
         self.show_results_button = tk.Button(self, text="Show Voting Results", command=self.show_results)
         self.show_results_button.pack(pady=(0, 10))
 
+        self.show_projection_button = tk.Button(self, text="Show Provisional Results", command=self.show_projection)
+        self.show_projection_button.pack(pady=(0, 10))
+
+        self.show_turnout_button = tk.Button(self, text="Show Turnout", command=self.show_turnout)
+        self.show_turnout_button.pack(pady=(0, 10))
+
+        self.verify_results_button = tk.Button(self, text="Verify Results", command=self.verify_results)
+        self.verify_results_button.pack(pady=(0, 10))
+
         # bind and clear
         self.entry_name.bind("<FocusIn>", lambda event: self.clear_message_and_selection())
         self.position_dropdown.bind("<Button-1>", lambda event: self.clear_message_and_selection())
@@ -118,21 +169,94 @@ class AdminApp(tk.Tk):
         results_window = ResultsWindow(self, votes)
         self.wait_window(results_window)
 
+    def show_projection(self):
+        """Displays provisional results projected from a random ballot sample."""
+        projection = Projection(BallotSampler(ballot_log_paths(self.votes_directory())), self.candidate_rules)
+        results_window = ResultsWindow(self, None, projection)
+        self.wait_window(results_window)
+
+    def show_turnout(self):
+        """Displays rolling turnout per kiosk in a separate window."""
+        turnout_window = TurnoutWindow(self, self.turnout)
+        self.wait_window(turnout_window)
+
+    def refresh_turnout(self):
+        """Adds the ballots committed since the last refresh to the turnout."""
+        self.turnout.refresh(self.votes_directory())
+
+    def votes_directory(self):
+        """Directory that ballot reads are served from.
+
+        :return: The replica directory, or the election directory.
+        :rtype: str
+        """
+        return self.replica_directory or self.directory
+
+    def replication_lag(self):
+        """Describes how far the replica is behind the primary.
+
+        :return: The lag description, or None when not reading a replica.
+        :rtype: str
+        """
+        if self.replica_directory is None:
+            return None
+        state = read_replica_state(self.replica_directory)
+        if state is None:
+            return "Replica has not synced yet"
+        metrics = state["metrics"]
+        return (f"Replica lag {metrics['commit_lag']:.2f}s, "
+                f"last heartbeat {time.time() - metrics['last_heartbeat']:.0f}s ago")
+
     def open_add_voter_page(self):
         """Opens the AddVoterPage for adding new voters."""
         self.root.withdraw()
         add_voter_page = AddVoterPage(self) 
         add_voter_page.mainloop()
         
+    def build_duplicate_index(self):
+        """Starts building the near-duplicate index of the saved voter roll
+        on a background thread, unless it is built or being built.
+
+        The index is set on duplicate_index when done, the voter page keeps
+        it up to date from then on.
+        """
+        if self.duplicate_index is not None or self.duplicate_building:
+            return
+        self.duplicate_building = True
+        generation = self.duplicate_generation
+
+        def build():
+            index = NearDuplicateIndex()
+            index.build(self.snapshot.voters())
+            # a roll saved while building is not in this index
+            if generation == self.duplicate_generation:
+                self.duplicate_index = index
+            self.duplicate_building = False
+
+        threading.Thread(target=build, daemon=True).start()
+
+    def drop_duplicate_index(self):
+        """Discards the near-duplicate index, and any being built, after the
+        voter roll was saved without it."""
+        self.duplicate_generation += 1
+        self.duplicate_index = None
+
     def add_candidate(self):
         """Adds a candidate to the list."""
         name = self.entry_name.get()
         position = self.selected_position.get()
         if name and position:
+            try:
+                self.candidate_rules.restore(position, name)
+            except ValueError as error:
+                # ballots store the name, a new candidate can't take one that counts for someone else
+                self.display_message(f"{error}, choose another name.", "red")
+                return
             candidate = Candidate(name, position)
             if position not in self.candidates_dict:
                 self.candidates_dict[position] = []
             self.candidates_dict[position].append(candidate)
+            self.candidate_index.add(position, name)
             self.refresh_candidates_listboxes()
             self.display_message(f"Candidate {name} added successfully for {position}!", "green")
             self.entry_name.delete(0, tk.END)
@@ -141,64 +265,130 @@ class AdminApp(tk.Tk):
             self.display_message("Name and Position are required fields.", "red")
 
 
-    def delete_candidate(self):
-        """Deletes the selected candidate from the list."""
-        selected_listbox = None
+    def selected_candidate(self):
+        """The candidate selected in the focused listbox.
+
+        Shows a message when there is none.
+
+        :return: A (position, name) pair, or None.
+        :rtype: tuple
+        """
         for position, listbox in self.candidates_listboxes.items():
             if listbox == self.root.focus_get():
-                selected_listbox = listbox
-                break
-        if selected_listbox:
-            selected_index = selected_listbox.curselection()
-            if selected_index:
-                candidate_name = selected_listbox.get(selected_index)
-                position = [pos for pos, lb in self.candidates_listboxes.items() if lb == selected_listbox][0]
-                if candidate_name in [candidate.name for candidate in self.candidates_dict.get(position, [])]:
-                    self.candidates_dict[position] = [candidate for candidate in self.candidates_dict.get(position, []) if candidate.name != candidate_name]
-                    selected_listbox.delete(selected_index)
-                    self.display_message(f"{candidate_name} deleted successfully!", "green")
-                else:
-                    self.display_message(f"{candidate_name} not found for deletion.", "red")
-            else:
-                self.display_message("No candidate selected for deletion.", "red")
+                selected_index = listbox.curselection()
+                # the "more matches" row after the shown candidates is not a candidate
+                if not selected_index or selected_index[0] >= len(self.shown_candidates[position]):
+                    self.display_message("No candidate selected.", "red")
+                    return None
+                name = listbox.get(selected_index)
+                if name not in [candidate.name for candidate in self.candidates_dict.get(position, [])]:
+                    self.display_message(f"{name} not found.", "red")
+                    return None
+                return position, name
+        self.display_message("No candidate list selected.", "red")
+        return None
+
+    def remove_candidate(self, position, name):
+        """Takes a candidate off the list and out of the search index.
+
+        :param position: The candidate's position.
+        :type position: str
+
+        :param name: The candidate's name.
+        :type name: str
+        """
+        self.candidates_dict[position] = [candidate for candidate in self.candidates_dict.get(position, []) if candidate.name != name]
+        while self.candidate_index.remove(position, name):
+            pass
+
+    def delete_candidate(self):
+        """Deletes the selected candidate from the list, moving their votes to the withdrawn bucket."""
+        selected = self.selected_candidate()
+        if selected:
+            position, candidate_name = selected
+            self.remove_candidate(position, candidate_name)
+            self.candidate_rules.delete(position, candidate_name)
+            self.refresh_candidates_listboxes()
+            self.display_message(f"{candidate_name} deleted successfully!", "green")
+
+    def rename_candidate(self):
+        """Renames the selected candidate to the name entered, keeping their votes."""
+        selected = self.selected_candidate()
+        new_name = self.entry_name.get()
+        if selected and new_name:
+            position, candidate_name = selected
+            if new_name in [candidate.name for candidate in self.candidates_dict.get(position, [])]:
+                self.display_message(f"{new_name} is already a candidate, merge instead.", "red")
+                return
+            try:
+                self.candidate_rules.rename(position, candidate_name, new_name)
+            except ValueError as error:
+                self.display_message(f"{error}, choose another name.", "red")
+                return
+            self.remove_candidate(position, candidate_name)
+            self.candidates_dict[position].append(Candidate(new_name, position))
+            self.candidate_index.add(position, new_name)
+            self.refresh_candidates_listboxes()
+            self.entry_name.delete(0, tk.END)
+            self.display_message(f"{candidate_name} renamed to {new_name}!", "green")
+        elif selected:
+            self.display_message("Enter the new name, then select the candidate.", "red")
+
+    def merge_candidate(self):
+        """Merges the selected candidate into the candidate named in the entry."""
+        selected = self.selected_candidate()
+        into = self.entry_name.get()
+        if selected and into:
+            position, candidate_name = selected
+            if into == candidate_name or into not in [candidate.name for candidate in self.candidates_dict.get(position, [])]:
+                self.display_message(f"Enter another {position} candidate to merge into.", "red")
+                return
+            self.remove_candidate(position, candidate_name)
+            self.candidate_rules.merge(position, candidate_name, into)
+            self.refresh_candidates_listboxes()
+            self.entry_name.delete(0, tk.END)
+            self.display_message(f"{candidate_name} merged into {into}!", "green")
+        elif selected:
+            self.display_message("Enter the candidate to merge into, then select the candidate.", "red")
+
+    def verify_results(self):
+        """Checks the kiosks' results against a full rescan of every ballot."""
+        results = self.candidate_rules.apply(self.snapshot.current_tallies(self.directory))
+        mismatched = verify_results(self.directory, results, self.candidate_rules)
+        if mismatched:
+            self.display_message(f"Results differ from a full rescan for {', '.join(mismatched)}!", "red")
         else:
-            self.display_message("No candidate list selected for deletion.", "red")
+            self.display_message("Results match a full rescan of every ballot.", "green")
 
     def load_candidates(self):
-        """Loads candidate data from CSV file."""
-        try:
-            with open('candidates.csv', 'r') as file:
-                reader = csv.reader(file)
-                candidates_data = {}
-                next(reader, None)
-                for row in reader:
-                    if len(row) >= 2:
-                        name, position = row[:2]
-                        if position not in candidates_data:
-                            candidates_data[position] = []
-                        candidate = Candidate(name, position)
-                        candidates_data[position].append(candidate)
-                self.candidates_dict = candidates_data
-                self.refresh_candidates_listboxes()
-        except FileNotFoundError:
-            pass
+        """Loads candidate data from the election snapshot."""
+        candidates_data = {}
+        self.candidate_index = CandidateIndex()
+        for name, position in self.snapshot.candidates:
+            if position not in candidates_data:
+                candidates_data[position] = []
+            candidates_data[position].append(Candidate(name, position))
+            self.candidate_index.add(position, name)
+        self.candidates_dict = candidates_data
+        self.refresh_candidates_listboxes()
 
     def refresh_candidates_listboxes(self):
-        """Refreshes the listboxes with the current data."""
-        for listbox in self.candidates_listboxes.values():
-            listbox.delete(0, tk.END)
-        for position, candidates in self.candidates_dict.items():
-            for candidate in candidates:
-                self.candidates_listboxes[position].insert(tk.END, candidate.name)
+        """Refreshes the listboxes with the current data, filtered by the
+        search text above each list."""
+        for position, listbox in self.candidates_listboxes.items():
+            show_matches(listbox, self.shown_candidates[position], self.candidate_index, position,
+                         self.search_entries[position].get())
 
     def save_candidates(self):
-        """Saves the candidate data to CSV file."""
-        with open('candidates.csv', 'w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(["Name", "Position"])
-            for candidates in self.candidates_dict.values():
-                for candidate in candidates:
-                    writer.writerow([candidate.name, candidate.position])
+        """Saves the candidate data to the election snapshot and exports the CSV file."""
+        candidates = [(candidate.name, candidate.position)
+                      for candidates in self.candidates_dict.values() for candidate in candidates]
+        try:
+            self.snapshot.with_candidates(candidates).checkpoint(self.directory)
+            self.candidate_rules.save(self.directory)
+        except PermissionError:
+            self.display_message("Must close open list file to save!", "red")
+            return
         self.display_message("Candidate list saved successfully!", "green")
 
     def clear_message_and_selection(self):
@@ -219,22 +409,28 @@ class AdminApp(tk.Tk):
         self.message_label.config(text=message, fg=color)
         
     def load_votes(self):
-        """Loads voting data from a JSON file.
+        """Loads voting data from the replica, or else from the snapshot
+        tallies and the ballots committed to kiosk shards since, with the
+        candidate deletes, renames and merges applied.
 
-        :return: A dictionary containing voting data.
+        :return: A dictionary of position to a Counter of candidate votes.
         :rtype: dict
         """
-        try:
-            with open('votes.json', 'r') as json_file:
-                votes_data = json.load(json_file)
-            return votes_data
-        except FileNotFoundError:
-            return None
-    
+        if self.replica_directory is not None:
+            state = read_replica_state(self.replica_directory)
+            return self.candidate_rules.apply(state["tallies"]) if state is not None else {}
+        return self.candidate_rules.apply(self.snapshot.current_tallies(self.directory))
+
 class ResultsWindow(tk.Toplevel):
     """Window to display voting results."""
 
-    def __init__(self, admin_app, votes):
+    # ballots added to a provisional sample per refinement step
+    PROJECTION_BATCH = 200
+
+    # provisional sampling stops once every margin is this tight
+    PROJECTION_TARGET_MARGIN = 0.01
+
+    def __init__(self, admin_app, votes, projection=None):
         """Initializes the ResultsWindow.
 
         :param admin_app: The main AdminApp window.
@@ -242,12 +438,26 @@ class ResultsWindow(tk.Toplevel):
 
         :param votes: The voting data to be displayed.
         :type votes: dict
+
+        :param projection: If given, shows provisional results from this
+            sample instead of the full tally.
+        :type projection: Projection
         """
         super().__init__(admin_app)
-        self.title("Voting Results")
         self.admin_app = admin_app
         self.votes = votes
-        self.create_bar_graphs()
+        self.projection = projection
+        self.projection_job = None
+        lag = admin_app.replication_lag()
+        if lag is not None:
+            self.lag_label = tk.Label(self, text=lag)
+            self.lag_label.pack(pady=5)
+        if projection is None:
+            self.title("Voting Results")
+            self.create_bar_graphs()
+        else:
+            self.title("Provisional Voting Results")
+            self.create_projection_graphs()
 
     def create_bar_graphs(self):
         """Creates bar graphs for each position from the voting data."""
@@ -279,6 +489,60 @@ class ResultsWindow(tk.Toplevel):
         canvas_widget = canvas.get_tk_widget()
         canvas_widget.pack()
 
+    def create_projection_graphs(self):
+        """Creates the provisional banner and starts refining the sample."""
+        self.provisional_label = tk.Label(self, text="", fg="red")
+        self.provisional_label.pack(pady=5)
+        self.projection_axes = {}
+        self.projection_canvases = {}
+        self.refine_projection()
+
+    def refine_projection(self):
+        """Samples another batch of ballots and redraws the projection."""
+        self.projection_job = None
+        added = self.projection.extend(self.PROJECTION_BATCH)
+        sampler = self.projection.sampler
+        self.provisional_label.config(
+            text=f"PROVISIONAL - projected from {self.projection.sampled} sampled ballots "
+                 f"of about {sampler.estimated_count()}, 95% confidence intervals")
+        for position, shares in self.projection.shares().items():
+            self.draw_projection_graph(position, shares)
+        if added and self.projection.max_margin() > self.PROJECTION_TARGET_MARGIN:
+            self.projection_job = self.after(100, self.refine_projection)
+
+    def draw_projection_graph(self, position, shares):
+        """Draws or updates the projected shares for one position.
+
+        :param position: The position for which the graph is drawn.
+        :type position: str
+
+        :param shares: (candidate, share, margin) tuples for the position.
+        :type shares: list
+        """
+        if position not in self.projection_axes:
+            fig, ax = plt.subplots(figsize=(4.5, 2.5))
+            canvas = FigureCanvasTkAgg(fig, master=self)
+            canvas.get_tk_widget().pack()
+            self.projection_axes[position] = ax
+            self.projection_canvases[position] = canvas
+        ax = self.projection_axes[position]
+        ax.clear()
+        candidates = [candidate for candidate, _, _ in shares]
+        percents = [share * 100 for _, share, _ in shares]
+        errors = [margin * 100 for _, _, margin in shares]
+        ax.bar(candidates, percents, yerr=errors, capsize=4, color="grey")
+        ax.set_xlabel("Candidates")
+        ax.set_ylabel("Projected Share (%)")
+        ax.set_title(f"Provisional Results for {position}")
+        self.projection_canvases[position].draw()
+
+    def destroy(self):
+        """Stops provisional sampling and closes the window."""
+        if self.projection_job is not None:
+            self.after_cancel(self.projection_job)
+            self.projection_job = None
+        super().destroy()
+
     def create_widgets(self):
         """Creates the widgets for the ResultsWindow."""
         self.label = tk.Label(self, text="Voting Results")
@@ -288,6 +552,72 @@ class ResultsWindow(tk.Toplevel):
         self.close_button = tk.Button(self, text="Close", command=self.master.destroy)
         self.close_button.pack(pady=10)
         
+class TurnoutWindow(tk.Toplevel):
+    """Window to display rolling turnout."""
+
+    # milliseconds between turnout refreshes while the window is open
+    REFRESH_INTERVAL = 5000
+
+    def __init__(self, admin_app, turnout, minutes=60):
+        """Initializes the TurnoutWindow.
+
+        :param admin_app: The main AdminApp window.
+        :type admin_app: AdminApp
+
+        :param turnout: Aggregated turnout to be displayed.
+        :type turnout: TurnoutAggregator
+
+        :param minutes: Number of trailing minutes to plot.
+        :type minutes: int
+        """
+        super().__init__(admin_app)
+        self.title("Turnout")
+        self.admin_app = admin_app
+        self.turnout = turnout
+        self.minutes = minutes
+        self.refresh_job = None
+        self.summary_label = tk.Label(self)
+        self.summary_label.pack(pady=10)
+        fig, self.turnout_axes = plt.subplots(figsize=(6, 3))
+        self.turnout_canvas = FigureCanvasTkAgg(fig, master=self)
+        self.turnout_canvas.get_tk_widget().pack()
+        self.refresh()
+
+    def refresh(self):
+        """Reads the ballots committed since the last refresh and redraws."""
+        self.admin_app.refresh_turnout()
+        self.create_summary()
+        self.create_turnout_graph()
+        self.refresh_job = self.after(self.REFRESH_INTERVAL, self.refresh)
+
+    def create_summary(self):
+        """Shows ballots cast in the last 10 minutes overall and per position."""
+        lines = [f"Last 10 minutes: {self.turnout.total.count(10)} ballots"]
+        for position, counter in self.turnout.by_position.items():
+            lines.append(f"{position}: {counter.count(10)}")
+        self.summary_label.config(text="\n".join(lines))
+
+    def create_turnout_graph(self):
+        """Plots ballots per minute for each kiosk."""
+        ax = self.turnout_axes
+        ax.clear()
+        minutes_ago = list(range(-self.minutes + 1, 1))
+        for kiosk, counter in self.turnout.by_kiosk.items():
+            ax.plot(minutes_ago, counter.series(self.minutes), label=kiosk)
+        ax.set_xlabel("Minutes Ago")
+        ax.set_ylabel("Ballots per Minute")
+        ax.set_title("Turnout by Kiosk")
+        if self.turnout.by_kiosk:
+            ax.legend()
+        self.turnout_canvas.draw()
+
+    def destroy(self):
+        """Stops refreshing and closes the window."""
+        if self.refresh_job is not None:
+            self.after_cancel(self.refresh_job)
+            self.refresh_job = None
+        super().destroy()
+
 if __name__ == "__main__":
     admin_user = Admin("Admin")
     admin_app = AdminApp(admin_user)
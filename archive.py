@@ -0,0 +1,296 @@
+import csv
+import io
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+from bisect import bisect_right
+from collections import Counter
+from ballot_store import (ARCHIVE_LOG, ARCHIVE_STATE, LEGACY_VOTES, add_tallies, is_shard, is_voted_journal,
+                          iter_ballots, merge_tallies)
+from candidate_rules import CANDIDATE_RULES, CandidateRules
+from election_host import CLOSED_ARCHIVE, read_positions
+from snapshot import SNAPSHOT_FILE, read_candidates_csv, read_voters_csv
+
+MAGIC = b"VOTEARCH"
+VERSION = 1
+
+# magic, version
+HEADER = struct.Struct("<8sI")
+# index offset, index length, magic
+TRAILER = struct.Struct("<QQ8s")
+
+# ballots per independently compressed block
+BLOCK_BALLOTS = 4096
+
+def election_file_names(directory='.'):
+    """Names of the files an open election keeps, which the archive replaces.
+
+    :param directory: Directory holding the election files.
+    :type directory: str
+
+    :return: A sorted list of file names.
+    :rtype: list
+    """
+    fixed = {ARCHIVE_LOG, ARCHIVE_STATE, LEGACY_VOTES, SNAPSHOT_FILE, CANDIDATE_RULES,
+             'voters.csv', 'candidates.csv'}
+    return sorted(name for name in os.listdir(directory)
+                  if name in fixed or is_shard(name) or is_voted_journal(name)
+                  or (name.startswith("voter_") and name.endswith(".txt")))
+
+def compress_block(ballots):
+    """Compresses ballots as JSON lines and counts their votes.
+
+    :param ballots: Ballot records.
+    :type ballots: list
+
+    :return: A tuple of (compressed block, position to candidate counts).
+    :rtype: tuple
+    """
+    tallies = {}
+    for ballot in ballots:
+        for position, candidate in ballot["choices"].items():
+            tallies.setdefault(position, Counter())[candidate] += 1
+    data = "".join(json.dumps(ballot) + "\n" for ballot in ballots).encode("utf-8")
+    return zlib.compress(data, 9), {position: dict(counts) for position, counts in tallies.items()}
+
+def close_election(directory='.', block_ballots=BLOCK_BALLOTS, remove=False):
+    """Writes a closed election to a compressed archive in its directory.
+
+    Ballots go into blocks that are compressed on their own, each indexed
+    with its position in the ballot order and its tallies. The roll, the
+    voted list, candidates, positions and candidate rules are kept too.
+    The archive is read back and checked against a full recount before
+    anything is removed.
+
+    :param directory: Directory holding the election files.
+    :type directory: str
+
+    :param block_ballots: Ballots per compressed block.
+    :type block_ballots: int
+
+    :param remove: Remove the election files the archive replaces.
+    :type remove: bool
+
+    :return: Path of the archive.
+    :rtype: str
+
+    :raises ValueError: If the election is already archived, or the
+        archive does not match the election files.
+    """
+    path = os.path.join(directory, CLOSED_ARCHIVE)
+    if os.path.exists(path):
+        raise ValueError(f"{directory} is already archived")
+    try:
+        with open(os.path.join(directory, LEGACY_VOTES), 'r') as file:
+            legacy = add_tallies({}, {position: Counter(candidates) for position, candidates in json.load(file).items()})
+    except FileNotFoundError:
+        legacy = {}
+    voted = sorted(name[len("voter_"):-len(".txt")] for name in os.listdir(directory)
+                   if name.startswith("voter_") and name.endswith(".txt"))
+    voters = io.StringIO()
+    writer = csv.writer(voters)
+    writer.writerow(['Name', 'VoterID'])
+    writer.writerows(read_voters_csv(directory))
+
+    blocks = []
+    with open(path + ".tmp", 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION))
+        offset = HEADER.size
+        ballots = []
+        first = 0
+
+        def write_block():
+            nonlocal offset, first
+            data, tallies = compress_block(ballots)
+            file.write(data)
+            blocks.append([offset, len(data), first, len(ballots), tallies])
+            offset += len(data)
+            first += len(ballots)
+            ballots.clear()
+
+        for ballot in iter_ballots(directory):
+            ballots.append(ballot)
+            if len(ballots) == block_ballots:
+                write_block()
+        if ballots:
+            write_block()
+        sections = {}
+        for name, data in (("voters", voters.getvalue()), ("voted", "\n".join(voted))):
+            data = zlib.compress(data.encode("utf-8"), 9)
+            file.write(data)
+            sections[name] = [offset, len(data)]
+            offset += len(data)
+        index = zlib.compress(json.dumps({
+            "meta": {
+                "closed_at": time.time(),
+                "positions": read_positions(directory),
+                "candidates": read_candidates_csv(directory),
+                "rules": CandidateRules.load(directory).rules,
+                "legacy_tallies": {position: dict(counts) for position, counts in legacy.items()},
+                "ballots": first,
+                "voters": len(read_voters_csv(directory)),
+                "voted": len(voted),
+            },
+            "blocks": blocks,
+            "sections": sections,
+        }).encode("utf-8"), 9)
+        file.write(index)
+        file.write(TRAILER.pack(offset, len(index), MAGIC))
+        file.flush()
+        os.fsync(file.fileno())
+
+    archive = ColdArchive(path + ".tmp")
+    archived = {position: +counts for position, counts in archive.tallies().items()}
+    if archived != {position: +counts for position, counts in merge_tallies(directory).items()}:
+        os.remove(path + ".tmp")
+        raise ValueError(f"Archive of {directory} does not match its ballots")
+    os.replace(path + ".tmp", path)
+    if remove:
+        for name in election_file_names(directory):
+            os.remove(os.path.join(directory, name))
+    return path
+
+class ColdArchive:
+    """Read access to a closed election's archive.
+
+    Opening reads only the index, results come from the per-block tallies,
+    and ballots are decompressed one block at a time when asked for.
+    """
+
+    def __init__(self, path):
+        """Opens an archive.
+
+        :param path: Path to the archive.
+        :type path: str
+
+        :raises ValueError: If the file is not an archive of a known version.
+        """
+        self.path = path
+        with open(path, 'rb') as file:
+            magic, version = HEADER.unpack(file.read(HEADER.size))
+            file.seek(-TRAILER.size, os.SEEK_END)
+            index_offset, index_length, end_magic = TRAILER.unpack(file.read(TRAILER.size))
+            if magic != MAGIC or end_magic != MAGIC or version != VERSION:
+                raise ValueError("Unsupported election archive")
+            file.seek(index_offset)
+            index = json.loads(zlib.decompress(file.read(index_length)))
+        self.meta = index["meta"]
+        self.blocks = index["blocks"]
+        self.sections = index["sections"]
+        self.block_starts = [first for _, _, first, _, _ in self.blocks]
+
+    def __len__(self):
+        """Number of ballots in the archive."""
+        return self.meta["ballots"]
+
+    def tallies(self):
+        """Votes per ballot code, summed from the block tallies.
+
+        :return: A dictionary of position to a Counter of votes.
+        :rtype: dict
+        """
+        tallies = add_tallies({}, self.meta["legacy_tallies"])
+        for _, _, _, _, block_tallies in self.blocks:
+            add_tallies(tallies, block_tallies)
+        return tallies
+
+    def results(self):
+        """Final results, with the election's candidate rules applied.
+
+        :return: A dictionary of position to a Counter of candidate votes.
+        :rtype: dict
+        """
+        return CandidateRules(self.meta["rules"]).apply(self.tallies())
+
+    def read_section(self, offset, length):
+        """Reads and decompresses one stored part of the archive.
+
+        :param offset: Byte offset of the part.
+        :type offset: int
+
+        :param length: Compressed length of the part.
+        :type length: int
+
+        :return: The decompressed bytes.
+        :rtype: bytes
+        """
+        with open(self.path, 'rb') as file:
+            file.seek(offset)
+            return zlib.decompress(file.read(length))
+
+    def read_block(self, number):
+        """Decompresses the ballots of one block.
+
+        :param number: The block number.
+        :type number: int
+
+        :return: A list of ballot records.
+        :rtype: list
+        """
+        offset, length, _, _, _ = self.blocks[number]
+        return [json.loads(line) for line in self.read_section(offset, length).splitlines()]
+
+    def ballots(self, start=0, stop=None):
+        """Ballots in a range of the ballot order, decompressing only the
+        blocks that hold them.
+
+        Indexes work like a list slice, negative ones count from the end.
+
+        :param start: Index of the first ballot.
+        :type start: int
+
+        :param stop: Index after the last ballot, defaults to the end.
+        :type stop: int
+
+        :return: A list of ballot records.
+        :rtype: list
+        """
+        start, stop, _ = slice(start, stop).indices(len(self))
+        ballots = []
+        if start >= stop:
+            return ballots
+        for number in range(bisect_right(self.block_starts, start) - 1, len(self.blocks)):
+            _, _, first, count, _ = self.blocks[number]
+            if first >= stop:
+                break
+            block = self.read_block(number)
+            ballots.extend(block[max(start - first, 0):stop - first])
+        return ballots
+
+    def voters(self):
+        """The voter roll when the election was closed.
+
+        :return: A list of (name, voter_id) pairs.
+        :rtype: list
+        """
+        reader = csv.reader(io.StringIO(self.read_section(*self.sections["voters"]).decode("utf-8")))
+        next(reader, None)
+        return [(row[0], row[1]) for row in reader if len(row) >= 2]
+
+    def voted(self):
+        """Login IDs of everyone who voted.
+
+        :return: A sorted list of login IDs.
+        :rtype: list
+        """
+        data = self.read_section(*self.sections["voted"]).decode("utf-8")
+        return data.split("\n") if data else []
+
+if __name__ == "__main__":
+    # python archive.py close [directory] [--remove]
+    # python archive.py results <archive>
+    # python archive.py ballots <archive> <start> <stop>
+    args = [arg for arg in sys.argv[1:] if arg != "--remove"]
+    if args and args[0] == "close":
+        print(f"Wrote {close_election(args[1] if len(args) > 1 else '.', remove='--remove' in sys.argv)}")
+    elif len(args) > 1 and args[0] == "results":
+        for position, counts in ColdArchive(args[1]).results().items():
+            print(f"{position}: " + ", ".join(f"{candidate} {count}" for candidate, count in counts.most_common()))
+    elif len(args) > 3 and args[0] == "ballots":
+        for ballot in ColdArchive(args[1]).ballots(int(args[2]), int(args[3])):
+            print(json.dumps(ballot))
+    else:
+        print("usage: python archive.py close [directory] [--remove] | results <archive> | ballots <archive> <start> <stop>")
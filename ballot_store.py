@@ -0,0 +1,646 @@
+import errno
+import json
+import os
+import re
+import socket
+import sys
+import time
+from collections import Counter, deque
+
+# compacted ballots and the tallies of everything folded into them
+ARCHIVE_LOG = 'votes-archive.jsonl'
+ARCHIVE_STATE = 'votes-archive.json'
+
+# tallies recorded before ballots were sharded
+LEGACY_VOTES = 'votes.json'
+
+# submission IDs each kiosk remembers for spotting retried ballots
+DEDUP_WINDOW = 10000
+
+# bytes at the end of a shard searched for a ballot whose write raised
+TAIL_BYTES = 65536
+
+# voters held back and written to the voted journal together, in sorted order
+VOTED_BATCH = 20
+
+def default_kiosk_id():
+    """Kiosk ID used when none is configured.
+
+    :return: The host name of this machine.
+    :rtype: str
+    """
+    return socket.gethostname()
+
+def shard_name(kiosk_id, session):
+    """File name of the active shard for one kiosk session.
+
+    :param kiosk_id: The kiosk ID.
+    :type kiosk_id: str
+
+    :param session: Number that makes the name unique among the kiosk's shards.
+    :type session: int
+
+    :return: The shard file name.
+    :rtype: str
+    """
+    return f"votes.{re.sub(r'[^A-Za-z0-9_-]', '_', kiosk_id)}.{session}.jsonl"
+
+def voted_journal_name(kiosk_id, session):
+    """File name of the journal of voters who voted during one kiosk session.
+
+    Kept apart from the ballot shard, and written in sorted batches without
+    timestamps, so ballots cannot be matched to voters by order or time.
+
+    :param kiosk_id: The kiosk ID.
+    :type kiosk_id: str
+
+    :param session: The session number of the matching shard.
+    :type session: int
+
+    :return: The journal file name.
+    :rtype: str
+    """
+    return f"voted.{re.sub(r'[^A-Za-z0-9_-]', '_', kiosk_id)}.{session}.jsonl"
+
+def is_voted_journal(file_name):
+    """Checks if a file name is a voted journal.
+
+    :param file_name: The file name to check.
+    :type file_name: str
+
+    :return: True if the file is a voted journal, False if not.
+    :rtype: bool
+    """
+    return file_name.startswith("voted.") and file_name.endswith(".jsonl")
+
+def shard_stem(file_name):
+    """Name that identifies a shard whether it is active or closed.
+
+    :param file_name: The shard file name.
+    :type file_name: str
+
+    :return: The file name without its state and extension.
+    :rtype: str
+    """
+    return file_name[:-len(".closed.jsonl")] if is_closed_shard(file_name) else file_name[:-len(".jsonl")]
+
+def submission_sequence(submission_id):
+    """Sequence number at the start of a submission ID.
+
+    :param submission_id: The submission ID.
+    :type submission_id: str
+
+    :return: The sequence number.
+    :rtype: int
+    """
+    return int(submission_id[:16], 16)
+
+def shard_session(file_name):
+    """Session number of a shard, which orders one kiosk's shards.
+
+    :param file_name: The shard file name.
+    :type file_name: str
+
+    :return: The session number.
+    :rtype: int
+    """
+    return int(shard_stem(file_name).rsplit(".", 1)[1])
+
+def append_records(path, records):
+    """Appends JSON records as lines with a single write, so a reader
+    never sees a partial line followed by another record.
+
+    :param path: Path to the log.
+    :type path: str
+
+    A short write, such as on a full disk, is cut back off the log so the
+    next append does not join onto half a line.
+
+    :param path: Path to the log.
+    :type path: str
+
+    :param records: The records to append.
+    :type records: list
+
+    :raises OSError: If the records could not all be written; none of them
+        are left in the log.
+    """
+    lines = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        # each log has one writer, so nothing else appends after size
+        size = os.fstat(fd).st_size
+        try:
+            written = os.write(fd, lines)
+        except OSError:
+            os.ftruncate(fd, size)
+            raise
+        if written != len(lines):
+            os.ftruncate(fd, size)
+            raise OSError(errno.ENOSPC, f"Short write to {path}")
+    finally:
+        os.close(fd)
+
+def append_record(path, record):
+    """Appends one JSON record as a line with a single write.
+
+    :param path: Path to the log.
+    :type path: str
+
+    :param record: The record to append.
+    :type record: dict
+    """
+    append_records(path, [record])
+
+def is_shard(file_name):
+    """Checks if a file name is an active or closed ballot shard.
+
+    :param file_name: The file name to check.
+    :type file_name: str
+
+    :return: True if the file is a shard, False if not.
+    :rtype: bool
+    """
+    return file_name.startswith("votes.") and file_name.endswith(".jsonl")
+
+def is_closed_shard(file_name):
+    """Checks if a file name is a closed ballot shard.
+
+    :param file_name: The file name to check.
+    :type file_name: str
+
+    :return: True if the file is a closed shard, False if not.
+    :rtype: bool
+    """
+    return is_shard(file_name) and file_name.endswith(".closed.jsonl")
+
+class SubmissionWindow:
+    """The most recent submission IDs committed by one kiosk.
+
+    Holds a bounded number of IDs so duplicate checks are a set lookup.
+    The high-water mark is the latest ID that has dropped out of the
+    window. A kiosk issues its IDs in order, so an ID at or below the mark
+    was committed before its retry.
+    """
+
+    def __init__(self, size=DEDUP_WINDOW, high_water=""):
+        """Initializes an empty SubmissionWindow.
+
+        :param size: Most IDs remembered.
+        :type size: int
+
+        :param high_water: Latest ID already forgotten.
+        :type high_water: str
+        """
+        self.size = size
+        self.high_water = high_water
+        self.order = deque()
+        self.ids = set()
+
+    def __contains__(self, submission_id):
+        """Checks if an ID was committed, within the window or before it.
+
+        :param submission_id: The submission ID.
+        :type submission_id: str
+
+        :return: True if the ID was committed, False if not.
+        :rtype: bool
+        """
+        return submission_id in self.ids or submission_id <= self.high_water
+
+    def add(self, submission_id):
+        """Remembers a committed ID, forgetting the oldest once full.
+
+        :param submission_id: The submission ID.
+        :type submission_id: str
+        """
+        self.order.append(submission_id)
+        self.ids.add(submission_id)
+        if len(self.order) > self.size:
+            forgotten = self.order.popleft()
+            self.ids.discard(forgotten)
+            self.high_water = max(self.high_water, forgotten)
+
+class BallotStore:
+    """Append-only ballot shard written by a single kiosk.
+
+    Every kiosk writes its own shard, so the vote path takes no lock shared
+    with other kiosks. Ballots submitted with an ID are committed once:
+    a retry with the same ID is acknowledged without writing again.
+    """
+
+    def __init__(self, directory='.', kiosk_id=None):
+        """Initializes a BallotStore.
+
+        :param directory: Directory holding the ballot shards.
+        :type directory: str
+
+        :param kiosk_id: ID recorded on every ballot written by this store.
+        :type kiosk_id: str
+        """
+        self.directory = directory
+        self.kiosk_id = kiosk_id or default_kiosk_id()
+        self.last_timestamp = 0.0
+        self.failed_submissions = set()
+        self.pending_voted = []
+        # ends this store's submission IDs, so two processes started with the
+        # same kiosk ID (such as the host name default) never issue the same one
+        self.submission_suffix = os.urandom(8).hex()
+        self.start_shard()
+        self.submissions = self.recover_submissions()
+        committed = [self.submissions.high_water, *self.submissions.order]
+        self.last_submission = max((submission_sequence(submission_id) for submission_id in committed if submission_id),
+                                   default=0)
+
+    def recover_submissions(self):
+        """Rebuilds the submission window from this kiosk's newest shards.
+
+        IDs in shards that were archived are covered by the high-water mark
+        compaction records for the kiosk.
+
+        :return: The submission window.
+        :rtype: SubmissionWindow
+        """
+        state = load_archive_state(self.directory)
+        window = SubmissionWindow(high_water=state.get("high_water", {}).get(self.kiosk_id, ""))
+        prefix = os.path.basename(self.path).rsplit(".", 2)[0] + "."
+        paths = [path for path in shard_paths(self.directory) if os.path.basename(path).startswith(prefix)]
+        paths.sort(key=lambda path: shard_session(os.path.basename(path)), reverse=True)
+        newest_first = []
+        found = 0
+        for path in paths:
+            submission_ids = [ballot["submission"] for ballot in read_ballots(path) if "submission" in ballot]
+            newest_first.append(submission_ids)
+            found += len(submission_ids)
+            if found >= window.size:
+                break
+        for submission_ids in reversed(newest_first):
+            for submission_id in submission_ids:
+                window.add(submission_id)
+        return window
+
+    def start_shard(self):
+        """Points this store at a new, not yet created shard and voted journal."""
+        session = time.time_ns()
+        self.path = os.path.join(self.directory, shard_name(self.kiosk_id, session))
+        self.voted_path = os.path.join(self.directory, voted_journal_name(self.kiosk_id, session))
+
+    def new_submission_id(self):
+        """Next ID for one ballot submission, reused when it is retried.
+
+        IDs start with a sequence number counting up from the newest one
+        this kiosk committed, so later IDs sort after earlier ones whatever
+        the wall clock does, and end with a random suffix drawn per store.
+
+        :return: The submission ID.
+        :rtype: str
+        """
+        self.last_submission += 1
+        return f"{self.last_submission:016x}{self.submission_suffix}"
+
+    def next_timestamp(self):
+        """Wall clock timestamp that strictly increases within this store.
+
+        :return: Seconds since the epoch.
+        :rtype: float
+        """
+        self.last_timestamp = max(time.time(), self.last_timestamp + 1e-6)
+        return self.last_timestamp
+
+    def append(self, choices, submission_id=None):
+        """Commits a ballot to this kiosk's shard.
+
+        :param choices: A dictionary of position to selected candidate name.
+        :type choices: dict
+
+        :param submission_id: ID from new_submission_id, the same for every
+            retry of one ballot. Without one the ballot is always written.
+        :type submission_id: str
+
+        :return: The committed ballot record, or None if the submission was
+            already committed.
+        :rtype: dict
+
+        :raises OSError: If the ballot could not be written, it may be
+            retried with the same ID.
+        """
+        if submission_id is not None:
+            if submission_id in self.submissions:
+                return None
+            if submission_id in self.failed_submissions and self.in_shard_tail(submission_id):
+                self.failed_submissions.discard(submission_id)
+                self.submissions.add(submission_id)
+                return None
+        ballot = {"ts": self.next_timestamp(), "kiosk": self.kiosk_id, "choices": choices}
+        if submission_id is not None:
+            ballot["submission"] = submission_id
+        try:
+            append_record(self.path, ballot)
+        except OSError:
+            if submission_id is not None:
+                # the line may have landed before the error, checked on retry
+                self.failed_submissions.add(submission_id)
+            raise
+        if submission_id is not None:
+            self.failed_submissions.discard(submission_id)
+            self.submissions.add(submission_id)
+        return ballot
+
+    def in_shard_tail(self, submission_id):
+        """Checks if a complete ballot line with a submission ID ends the shard.
+
+        :param submission_id: The submission ID.
+        :type submission_id: str
+
+        :return: True if the ballot was written, False if not.
+        :rtype: bool
+        """
+        try:
+            with open(self.path, 'rb') as shard:
+                shard.seek(max(0, os.path.getsize(self.path) - TAIL_BYTES))
+                tail = shard.read()
+        except FileNotFoundError:
+            return False
+        needle = json.dumps({"submission": submission_id})[1:-1].encode("utf-8")
+        return any(needle in line for line in tail.split(b"\n")[:-1])
+
+    def record_voted(self, login_id):
+        """Adds a voter to this kiosk's voted journal.
+
+        Voters are written VOTED_BATCH at a time, so a journal line cannot
+        be paired with the ballot written just before it. The marker file is
+        what stops a second vote; the journal only informs replicas.
+
+        :param login_id: The voter's login ID.
+        :type login_id: str
+        """
+        self.pending_voted.append(login_id)
+        if len(self.pending_voted) >= VOTED_BATCH:
+            self.flush_voted()
+
+    def flush_voted(self):
+        """Writes the held back voters to the voted journal in sorted order."""
+        if self.pending_voted:
+            append_records(self.voted_path, [{"login_id": login_id} for login_id in sorted(self.pending_voted)])
+            self.pending_voted = []
+
+    def close(self):
+        """Closes the active shard so the compaction job can fold it.
+
+        Held back voters are written first. The next ballot from this kiosk
+        starts a new shard.
+        """
+        self.flush_voted()
+        if os.path.exists(self.path):
+            os.replace(self.path, f"{self.path[:-len('.jsonl')]}.closed.jsonl")
+        self.start_shard()
+
+def read_ballots(path):
+    """Yields every committed ballot in one log, in log order.
+
+    A trailing line without a newline is a write still in progress and is
+    skipped.
+
+    :param path: Path to a shard or archive log.
+    :type path: str
+
+    :return: An iterator of ballot records.
+    """
+    try:
+        with open(path, 'r', encoding="utf-8") as file:
+            for line in file:
+                if line.endswith("\n"):
+                    yield json.loads(line)
+    except FileNotFoundError:
+        return
+
+def load_archive_state(directory='.'):
+    """Loads the tallies and bookkeeping of the compacted archive.
+
+    :param directory: Directory holding the ballot shards.
+    :type directory: str
+
+    :return: A dictionary with "tallies" (position to candidate counts),
+        "folded" (shard names archived but not yet removed), "archived"
+        (stems of every shard ever archived), "archive_bytes" (size of the
+        archive log that the tallies cover) and "high_water" (kiosk ID to
+        latest archived submission ID).
+    :rtype: dict
+    """
+    try:
+        with open(os.path.join(directory, ARCHIVE_STATE), 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {"tallies": {}, "folded": [], "archived": [], "archive_bytes": 0, "high_water": {}}
+
+def shard_paths(directory='.', closed_only=False):
+    """Paths of the shards that have not been folded into the archive.
+
+    :param directory: Directory holding the ballot shards.
+    :type directory: str
+
+    :param closed_only: Only return closed shards.
+    :type closed_only: bool
+
+    :return: A sorted list of shard paths.
+    :rtype: list
+    """
+    folded = set(load_archive_state(directory)["folded"])
+    check = is_closed_shard if closed_only else is_shard
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if check(name) and name not in folded]
+
+def ballot_log_paths(directory='.'):
+    """Paths of every log holding individual ballots, archive first.
+
+    :param directory: Directory holding the ballot shards.
+    :type directory: str
+
+    :return: A list of log paths.
+    :rtype: list
+    """
+    return [os.path.join(directory, ARCHIVE_LOG)] + shard_paths(directory)
+
+def iter_ballots(directory='.'):
+    """Yields every committed ballot from the archive and all shards.
+
+    :param directory: Directory holding the ballot shards.
+    :type directory: str
+
+    :return: An iterator of ballot records.
+    """
+    for path in ballot_log_paths(directory):
+        yield from read_ballots(path)
+
+def iter_shard_tails(directory='.', covered=None):
+    """Yields the ballots in all unfolded shards past known offsets.
+
+    :param directory: Directory holding the ballot shards.
+    :type directory: str
+
+    :param covered: Shard stem to byte offset already read, advanced in
+        place past every ballot yielded.
+    :type covered: dict
+
+    :return: An iterator of ballot records.
+    """
+    covered = {} if covered is None else covered
+    for path in shard_paths(directory):
+        stem = shard_stem(os.path.basename(path))
+        offset = covered.get(stem, 0)
+        try:
+            with open(path, 'rb') as shard:
+                shard.seek(offset)
+                for line in shard:
+                    if not line.endswith(b"\n"):
+                        break
+                    offset += len(line)
+                    covered[stem] = offset
+                    yield json.loads(line)
+        except FileNotFoundError:
+            # closed between listing and opening, read under its new name next time
+            continue
+        covered[stem] = offset
+
+def tally_shards(directory='.', covered=None):
+    """Counts the ballots in all unfolded shards past known offsets.
+
+    :param directory: Directory holding the ballot shards.
+    :type directory: str
+
+    :param covered: Shard stem to byte offset already counted elsewhere.
+    :type covered: dict
+
+    :return: A tuple of (position to Counter of candidate votes, shard stem
+        to byte offset counted up to, including the earlier offsets).
+    :rtype: tuple
+    """
+    tallies = {}
+    covered = dict(covered or {})
+    for ballot in iter_shard_tails(directory, covered):
+        for position, candidate in ballot["choices"].items():
+            tallies.setdefault(position, Counter())[candidate] += 1
+    return tallies, covered
+
+def base_tallies(directory='.'):
+    """Combines the legacy tallies and the archive tallies.
+
+    :param directory: Directory holding the ballot shards.
+    :type directory: str
+
+    :return: A dictionary of position to a Counter of candidate votes.
+    :rtype: dict
+    """
+    tallies = {}
+    try:
+        with open(os.path.join(directory, LEGACY_VOTES), 'r') as file:
+            for position, candidates in json.load(file).items():
+                tallies.setdefault(position, Counter()).update(candidates)
+    except FileNotFoundError:
+        pass
+    for position, counts in load_archive_state(directory)["tallies"].items():
+        tallies.setdefault(position, Counter()).update(counts)
+    return tallies
+
+def add_tallies(tallies, counts):
+    """Adds per-position counts into tallies in place.
+
+    :param tallies: Position to Counter of candidate votes, updated in place.
+    :type tallies: dict
+
+    :param counts: Position to candidate vote counts to add.
+    :type counts: dict
+
+    :return: The updated tallies.
+    :rtype: dict
+    """
+    for position, candidate_counts in counts.items():
+        tallies.setdefault(position, Counter()).update(candidate_counts)
+    return tallies
+
+def merge_tallies(directory='.'):
+    """Combines the legacy tallies, the archive tallies and all open shards.
+
+    :param directory: Directory holding the ballot shards.
+    :type directory: str
+
+    :return: A dictionary of position to a Counter of candidate votes.
+    :rtype: dict
+    """
+    return add_tallies(base_tallies(directory), tally_shards(directory)[0])
+
+def write_archive_state(directory, state):
+    """Atomically replaces the archive tallies and bookkeeping.
+
+    :param directory: Directory holding the ballot shards.
+    :type directory: str
+
+    :param state: The state as returned by load_archive_state.
+    :type state: dict
+    """
+    state_path = os.path.join(directory, ARCHIVE_STATE)
+    with open(state_path + ".tmp", 'w') as file:
+        json.dump(state, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(state_path + ".tmp", state_path)
+
+def compact(directory='.'):
+    """Folds closed shards into the archive log and its tallies.
+
+    The archive log is first cut back to the size recorded with the tallies
+    and shards already counted there are removed, so rerunning after a crash
+    never archives a shard twice.
+
+    :param directory: Directory holding the ballot shards.
+    :type directory: str
+
+    :return: Number of shards folded.
+    :rtype: int
+    """
+    state = load_archive_state(directory)
+    for name in state["folded"]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+    state["folded"] = []
+    closed = shard_paths(directory, closed_only=True)
+    if not closed:
+        return 0
+    tallies = {position: Counter(counts) for position, counts in state["tallies"].items()}
+    # latest archived submission per kiosk, kiosks recover their window from the shards after it
+    high_water = state.get("high_water", {})
+    archive_path = os.path.join(directory, ARCHIVE_LOG)
+    with open(archive_path, 'a+b') as archive:
+        archive.truncate(state["archive_bytes"])
+        archive.seek(0, os.SEEK_END)
+        for path in closed:
+            with open(path, 'rb') as shard:
+                for line in shard:
+                    if not line.endswith(b"\n"):
+                        continue
+                    archive.write(line)
+                    ballot = json.loads(line)
+                    for position, candidate in ballot["choices"].items():
+                        tallies.setdefault(position, Counter())[candidate] += 1
+                    if "submission" in ballot:
+                        high_water[ballot["kiosk"]] = max(high_water.get(ballot["kiosk"], ""), ballot["submission"])
+        archive.flush()
+        os.fsync(archive.fileno())
+        state["archive_bytes"] = archive.tell()
+    state["tallies"] = {position: dict(counts) for position, counts in tallies.items()}
+    state["folded"] = [os.path.basename(path) for path in closed]
+    state["archived"] = state.get("archived", []) + [shard_stem(name) for name in state["folded"]]
+    state["high_water"] = high_water
+    write_archive_state(directory, state)
+    for path in closed:
+        os.remove(path)
+    state["folded"] = []
+    write_archive_state(directory, state)
+    return len(closed)
+
+if __name__ == "__main__":
+    # compaction job: python ballot_store.py [directory]
+    folded = compact(sys.argv[1] if len(sys.argv) > 1 else '.')
+    print(f"Folded {folded} closed shards into {ARCHIVE_LOG}")
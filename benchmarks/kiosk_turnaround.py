@@ -0,0 +1,160 @@
+"""Per-voter turnaround without a display: a new login and voter window per
+voter (the flow before kiosk mode) vs one kiosk reused across voters.
+
+Each flow is timed from login to the ballot being ready for the next
+voter: credential check, ballot set up, voted check, ballot write and
+voted marker. The window per voter flow is timed twice, with the files it
+used then (voters.csv scan, votes.json rewrite) and with today's snapshot
+login and ballot shard, which isolates what reusing the window saves. Tk needs a display, so windows are stood in for by a Tcl
+interpreter per Tk root and listboxes by a list; widget creation, which
+only the old flow repeats per voter, is not counted.
+
+Usage: python benchmarks/kiosk_turnaround.py [voters per flow]
+"""
+import csv
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tkinter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from candidate_search import CandidateIndex, show_matches
+from election_host import ElectionPartition
+from snapshot import ElectionSnapshot
+from synthetic import POSITIONS, SyntheticElection
+
+class StubListbox:
+    """The listbox calls the ballot makes, on a list."""
+
+    def __init__(self):
+        """Initializes an empty StubListbox."""
+        self.rows = []
+
+    def size(self):
+        """Number of rows."""
+        return len(self.rows)
+
+    def insert(self, index, *items):
+        """Inserts rows before index, or at the end."""
+        index = len(self.rows) if index == "end" else index
+        self.rows[index:index] = items
+
+    def delete(self, first, last=None):
+        """Deletes rows first to last inclusive."""
+        last = len(self.rows) - 1 if last == "end" else first if last is None else last
+        del self.rows[first:last + 1]
+
+def old_flow(election, voter):
+    """Login window, then a new voter window that loads the candidates,
+    as main.py did before kiosk mode."""
+    directory = election.directory
+    name, voter_id = voter
+    # login screen root
+    tkinter.Tcl()
+    with open(os.path.join(directory, "voters.csv"), newline="") as file:
+        assert any(row["Name"] == name and row["VoterID"] == voter_id for row in csv.DictReader(file))
+    # voter app root, its listboxes filled from candidates.csv
+    tkinter.Tcl()
+    listboxes = {position: StubListbox() for position in POSITIONS}
+    with open(os.path.join(directory, "candidates.csv"), 'r') as file:
+        for row in csv.DictReader(file):
+            if row["Position"] in listboxes:
+                listboxes[row["Position"]].insert("end", row["Name"])
+    marker = os.path.join(directory, f"voter_{name}.txt")
+    assert not os.path.exists(marker)
+    ballot = {position: listbox.rows[0] for position, listbox in listboxes.items()}
+    votes_path = os.path.join(directory, "votes.json")
+    with open(votes_path, 'r') as file:
+        votes_data = json.load(file)
+    for position, candidate in ballot.items():
+        votes_data[position].append(candidate)
+    with open(votes_path, 'w') as file:
+        json.dump(votes_data, file)
+    with open(marker, 'w') as file:
+        file.write("voted")
+
+def window_flow(partition, voter):
+    """Login window, then a new voter window that loads the candidates,
+    with the snapshot login and ballot shard the kiosk uses."""
+    name, voter_id = voter
+    tkinter.Tcl()
+    assert partition.voter_roll.verify_voter(name, voter_id)
+    tkinter.Tcl()
+    listboxes = {position: StubListbox() for position in POSITIONS}
+    with open(os.path.join(partition.directory, "candidates.csv"), 'r') as file:
+        for row in csv.DictReader(file):
+            if row["Position"] in listboxes:
+                listboxes[row["Position"]].insert("end", row["Name"])
+    submission_id = partition.ballot_store.new_submission_id()
+    assert not partition.snapshot.has_voted(name, partition.directory)
+    ballot = {position: listbox.rows[0] for position, listbox in listboxes.items()}
+    partition.ballot_store.append(ballot, submission_id)
+    with open(partition.marker_path(name), 'w') as file:
+        file.write("voted")
+    partition.ballot_store.record_voted(name)
+
+def kiosk_flow(partition, kiosk, voter):
+    """Login form on the kiosk's ballot window, then the ballot reset for
+    the voter, as KioskApp does."""
+    name, voter_id = voter
+    assert partition.voter_roll.verify_voter(name, voter_id)
+    submission_id = partition.ballot_store.new_submission_id()
+    for position, (listbox, shown) in kiosk.listboxes.items():
+        show_matches(listbox, shown, kiosk.index, position, "")
+    assert not partition.snapshot.has_voted(name, partition.directory)
+    ballot = {position: listbox.rows[0] for position, (listbox, _) in kiosk.listboxes.items()}
+    partition.ballot_store.append(ballot, submission_id)
+    with open(partition.marker_path(name), 'w') as file:
+        file.write("voted")
+    partition.ballot_store.record_voted(name)
+
+class Kiosk:
+    """The kiosk's ballot listboxes and candidate index, built once."""
+
+    def __init__(self, partition):
+        """Builds the listboxes of a partition's positions."""
+        self.listboxes = {position: (StubListbox(), []) for position in POSITIONS}
+        self.index = CandidateIndex()
+        for name, position in partition.snapshot.candidates:
+            self.index.add(position, name)
+
+def summarize(latencies):
+    """Mean, p50 and p99 in milliseconds."""
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return statistics.mean(latencies) * 1000, percentiles[49] * 1000, percentiles[98] * 1000
+
+def time_calls(function, voters):
+    """Latency of function for every voter."""
+    latencies = []
+    for voter in voters:
+        start = time.perf_counter()
+        function(voter)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    with tempfile.TemporaryDirectory() as old_directory, tempfile.TemporaryDirectory() as new_directory:
+        old = SyntheticElection(old_directory, seed=0)
+        # the old flow kept every ballot in votes.json
+        with open(os.path.join(old_directory, "votes.json"), 'w') as file:
+            json.dump({position: [old.random_ballot()[position] for _ in range(old.ballots_cast)]
+                       for position in POSITIONS}, file)
+        new = SyntheticElection(new_directory, seed=0)
+        ElectionSnapshot.open(new_directory).checkpoint(new_directory)
+        partition = ElectionPartition(new_directory, "bench")
+        kiosk = Kiosk(partition)
+        unvoted = new.voters[new.ballots_cast:]
+        results = [
+            ("window, old files", time_calls(lambda voter: old_flow(old, voter), old.voters[old.ballots_cast:][:count])),
+            ("window, shards", time_calls(lambda voter: window_flow(partition, voter), unvoted[:count])),
+            ("kiosk, shards", time_calls(lambda voter: kiosk_flow(partition, kiosk, voter), unvoted[count:2 * count])),
+        ]
+        partition.ballot_store.flush_voted()
+    print(f"{'flow':<18} {'voters':>6} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for label, latencies in results:
+        print(f"{label:<18} {len(latencies):>6} " + " ".join(f"{value:>9.3f}" for value in summarize(latencies)))
@@ -0,0 +1,63 @@
+"""Multi-process ballot write throughput: one shared votes.json vs per-kiosk shards.
+
+Usage: python benchmarks/shard_throughput.py [ballots per kiosk]
+"""
+import fcntl
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ballot_store import BallotStore, merge_tallies
+
+CHOICES = {"President": "mark", "Vice-President": "veronica", "Secretary": "mary", "Treasurer": "betty"}
+
+def write_shared(directory, kiosk_id, ballots):
+    """Rewrites one shared votes.json under an exclusive lock per ballot."""
+    path = os.path.join(directory, "votes.json")
+    lock_path = os.path.join(directory, "votes.lock")
+    for _ in range(ballots):
+        with open(lock_path, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(path, 'r') as file:
+                    votes_data = json.load(file)
+            except FileNotFoundError:
+                votes_data = {position: [] for position in CHOICES}
+            for position, candidate in CHOICES.items():
+                votes_data[position].append(candidate)
+            with open(path, 'w') as file:
+                json.dump(votes_data, file)
+
+def write_sharded(directory, kiosk_id, ballots):
+    """Appends to this kiosk's own shard."""
+    store = BallotStore(directory, kiosk_id)
+    for _ in range(ballots):
+        store.append(CHOICES)
+
+def run(writer, kiosks, ballots):
+    """Runs one writer per kiosk process and returns ballots per second."""
+    with tempfile.TemporaryDirectory() as directory:
+        processes = [multiprocessing.Process(target=writer, args=(directory, f"kiosk{i}", ballots))
+                     for i in range(kiosks)]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+        counted = sum(merge_tallies(directory)["President"].values())
+        assert counted == kiosks * ballots, f"{writer.__name__} lost ballots: {counted}"
+    return kiosks * ballots / elapsed
+
+if __name__ == "__main__":
+    ballots = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    print(f"{'kiosks':>6} {'shared votes.json':>18} {'sharded':>12}  (ballots/s)")
+    for kiosks in (1, 2, 4, 8):
+        shared = run(write_shared, kiosks, ballots)
+        sharded = run(write_sharded, kiosks, ballots)
+        print(f"{kiosks:>6} {shared:>18.0f} {sharded:>12.0f}")
@@ -0,0 +1,173 @@
+"""Headless benchmarks of the kiosk and admin hot paths on a synthetic election.
+
+Measures login verification, vote submission, voted-state checks, roster
+saves and result tallying without a display, and reports throughput,
+p50/p99 latency and tracemalloc peak per operation. Results are compared
+with benchmarks/baseline.json and the exit status is 1 if any operation
+regressed by more than the tolerance.
+
+Usage: python benchmarks/suite.py [--voters N] [--candidates M] [--ballots B]
+                                  [--iterations I] [--tolerance T] [--save-baseline]
+
+Timings are machine specific; record a baseline with --save-baseline on the
+machine that runs the comparison.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ballot_store import BallotStore, merge_tallies
+from snapshot import ElectionSnapshot
+from synthetic import SyntheticElection
+from voter_roll import VoterRoll
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# calls traced for the memory peak, tracing slows every allocation down
+TRACED_CALLS = 5
+
+# slow whole-file operations run this fraction of the iterations
+SLOW_FRACTION = 20
+
+# absolute slack on top of the tolerance, sub-millisecond calls jitter by more than 2x
+LATENCY_SLACK_MS = 0.5
+PEAK_SLACK_KIB = 4
+
+def operations(election, iterations):
+    """Returns (name, call count, function of the call number) per operation."""
+    directory = election.directory
+    roll = VoterRoll(os.path.join(directory, 'voters.csv'))
+    snapshot = ElectionSnapshot.open(directory)
+    store = BallotStore(directory, "bench")
+    unvoted = election.voters[election.ballots_cast:]
+    slow = max(iterations // SLOW_FRACTION, TRACED_CALLS)
+
+    def verify_voter(i):
+        name, voter_id = election.random_voter()
+        assert roll.verify_voter(name, voter_id)
+
+    def has_voted(i):
+        snapshot.has_voted(election.random_voter()[0], directory)
+
+    def submit_vote(i):
+        # mirrors VoterApp.save_vote and mark_as_voted
+        login_id = unvoted[i % len(unvoted)][0] if unvoted else f"extra voter {i}"
+        store.append(election.random_ballot(), store.new_submission_id())
+        store.record_voted(login_id)
+        election.write_marker(login_id)
+
+    def save_roster(i):
+        # mirrors AddVoterPage.save_voter_list
+        snapshot.with_voters(election.voters).checkpoint(directory)
+
+    def tally_rescan(i):
+        merge_tallies(directory)
+
+    def tally_snapshot(i):
+        # mirrors AdminApp.load_votes
+        snapshot.current_tallies(directory)
+
+    return [
+        ("verify_voter", slow, verify_voter),
+        ("has_voted", iterations, has_voted),
+        ("tally_rescan", slow, tally_rescan),
+        ("tally_snapshot", iterations, tally_snapshot),
+        ("save_roster", slow, save_roster),
+        ("submit_vote", iterations, submit_vote),
+    ]
+
+def measure(calls, function):
+    """Times each call, then traces a few more for the allocation peak."""
+    latencies = []
+    start = time.perf_counter()
+    for i in range(calls):
+        call_start = time.perf_counter()
+        function(i)
+        latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    floor = tracemalloc.get_traced_memory()[0]
+    for i in range(calls, calls + TRACED_CALLS):
+        function(i)
+    peak = tracemalloc.get_traced_memory()[1] - floor
+    tracemalloc.stop()
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "calls": calls,
+        "throughput": calls / elapsed,
+        "p50_ms": percentiles[49] * 1000,
+        "p99_ms": percentiles[98] * 1000,
+        "peak_kib": peak / 1024,
+    }
+
+def regressions(results, baseline, tolerance):
+    """Lists the metrics that are worse than the baseline by more than the tolerance."""
+    found = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        # throughput is compared as mean time per call so the slack applies
+        checks = [("ms/call", 1000 / result["throughput"], 1000 / base["throughput"], LATENCY_SLACK_MS),
+                  ("p50_ms", result["p50_ms"], base["p50_ms"], LATENCY_SLACK_MS),
+                  ("p99_ms", result["p99_ms"], base["p99_ms"], LATENCY_SLACK_MS),
+                  ("peak_kib", result["peak_kib"], base["peak_kib"], PEAK_SLACK_KIB)]
+        for metric, value, base_value, slack in checks:
+            if value > base_value * tolerance + slack:
+                found.append(f"{name}: {metric} {value:.3f} vs baseline {base_value:.3f}")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless election benchmarks.")
+    parser.add_argument("--voters", type=int, default=10000)
+    parser.add_argument("--candidates", type=int, default=10, help="candidates per position")
+    parser.add_argument("--ballots", type=int, default=5000)
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tolerance", type=float, default=2.0, help="allowed slowdown factor")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+    sizes = {"voters": args.voters, "candidates": args.candidates, "ballots": args.ballots,
+             "iterations": args.iterations, "seed": args.seed}
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        election = SyntheticElection(directory, args.voters, args.candidates, args.ballots, seed=args.seed)
+        for name, calls, function in operations(election, args.iterations):
+            results[name] = measure(calls, function)
+
+    print(f"{'operation':<15} {'calls':>6} {'ops/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'peak KiB':>9}")
+    for name, result in results.items():
+        print(f"{name:<15} {result['calls']:>6} {result['throughput']:>10.0f} {result['p50_ms']:>9.3f} "
+              f"{result['p99_ms']:>9.3f} {result['peak_kib']:>9.1f}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump({"sizes": sizes, "results": results}, file, indent=2)
+            file.write("\n")
+        print(f"baseline written to {args.baseline}")
+        return 0
+    try:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+    except FileNotFoundError:
+        print("no baseline, run with --save-baseline to record one")
+        return 0
+    if baseline["sizes"] != sizes:
+        print(f"baseline was recorded with {baseline['sizes']}, not comparing")
+        return 0
+    found = regressions(results, baseline["results"], args.tolerance)
+    for regression in found:
+        print(f"REGRESSION {regression}")
+    return 1 if found else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""Synthetic election generator for the benchmarks.
+
+Writes N voters, M candidates per position and B cast ballots to a directory
+in the same files the kiosks and the admin app use.
+"""
+import os
+import random
+import string
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ballot_store import BallotStore
+from snapshot import write_candidates_csv, write_voters_csv
+
+POSITIONS = ["President", "Vice-President", "Secretary", "Treasurer"]
+
+def random_name(rng):
+    """Returns a random two-part name."""
+    return " ".join("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+                    for _ in range(2))
+
+class SyntheticElection:
+    """A generated election and the random choices used to exercise it."""
+
+    def __init__(self, directory, voters=10000, candidates=10, ballots=5000, kiosks=4, seed=0):
+        """Writes the candidates, voters, ballot shards and voted markers.
+
+        The first B voters have voted; the rest are left for submissions.
+        """
+        self.directory = directory
+        self.rng = random.Random(seed)
+        self.ballots_cast = min(ballots, voters)
+        self.candidates = {position: [random_name(self.rng) for _ in range(candidates)] for position in POSITIONS}
+        self.voters = [(random_name(self.rng), f"{i:07d}") for i in range(voters)]
+        write_candidates_csv(directory, [(name, position) for position, names in self.candidates.items()
+                                         for name in names])
+        write_voters_csv(directory, self.voters)
+        stores = [BallotStore(directory, f"kiosk{i}") for i in range(kiosks)]
+        for i, (name, _) in enumerate(self.voters[:self.ballots_cast]):
+            stores[i % kiosks].append(self.random_ballot())
+            stores[i % kiosks].record_voted(name)
+            self.write_marker(name)
+        for store in stores:
+            store.flush_voted()
+
+    def random_ballot(self):
+        """Returns one random candidate per position."""
+        return {position: self.rng.choice(names) for position, names in self.candidates.items()}
+
+    def random_voter(self):
+        """Returns a random registered (name, voter_id) pair."""
+        return self.rng.choice(self.voters)
+
+    def write_marker(self, login_id):
+        """Writes the voted marker file a kiosk leaves behind."""
+        with open(os.path.join(self.directory, f'voter_{login_id}.txt'), 'w') as file:
+            file.write('voted')
@@ -0,0 +1,218 @@
+import json
+import os
+import sys
+from collections import Counter
+from ballot_store import merge_tallies
+
+# remap rules for one election, kept with its other files
+CANDIDATE_RULES = 'candidate_rules.json'
+
+# results bucket for the votes of deleted candidates
+WITHDRAWN = "Withdrawn"
+
+class CandidateRules:
+    """Deletes, renames and merges of candidates, applied to tallies.
+
+    Ballots keep the candidate name they were cast for, their code. The
+    rules map every code to the candidate it counts for now, so an edit
+    mid-election changes results without rewriting or rescanning a ballot.
+    """
+
+    def __init__(self, rules=None):
+        """Initializes CandidateRules.
+
+        :param rules: Rules in the order they were made, as saved by save.
+        :type rules: list
+        """
+        self.rules = []
+        self.mapping = {}
+        self.withdrawn_from = {}
+        for rule in rules or []:
+            self.add_rule(rule)
+
+    @classmethod
+    def load(cls, directory='.'):
+        """Loads the rules of an election.
+
+        :param directory: Directory holding the election files.
+        :type directory: str
+
+        :return: The rules, empty if none were saved.
+        :rtype: CandidateRules
+        """
+        try:
+            with open(os.path.join(directory, CANDIDATE_RULES), 'r') as file:
+                return cls(json.load(file))
+        except FileNotFoundError:
+            return cls()
+
+    def save(self, directory='.'):
+        """Atomically writes the rules of an election.
+
+        :param directory: Directory holding the election files.
+        :type directory: str
+        """
+        path = os.path.join(directory, CANDIDATE_RULES)
+        with open(path + ".tmp", 'w') as file:
+            json.dump(self.rules, file, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def add_rule(self, rule):
+        """Records a rule and points every code that counted for its
+        candidate at the new target.
+
+        Takes time proportional to the number of candidates for the position.
+
+        :param rule: A dictionary with "op" (delete, rename, merge or
+            restore), "position", "name" and, except for delete and
+            restore, "to".
+        :type rule: dict
+        """
+        mapping = self.mapping.setdefault(rule["position"], {})
+        withdrawn_from = self.withdrawn_from.setdefault(rule["position"], {})
+        name = rule["name"]
+        if rule["op"] == "restore":
+            if mapping.get(name, name) != WITHDRAWN:
+                # renamed or merged away, or never deleted: nothing to restore
+                self.rules.append(rule)
+                return
+            # the name and every code withdrawn along with it count for it again
+            mapping[name] = name
+            for code, deleted in list(withdrawn_from.items()):
+                if deleted == name:
+                    mapping[code] = name
+                    del withdrawn_from[code]
+        else:
+            target = WITHDRAWN if rule["op"] == "delete" else rule["to"]
+            mapping.setdefault(name, name)
+            for code, current in mapping.items():
+                if current == name:
+                    mapping[code] = target
+                    if target == WITHDRAWN:
+                        withdrawn_from[code] = name
+        self.rules.append(rule)
+
+    def delete(self, position, name):
+        """Moves a candidate's votes to the withdrawn bucket.
+
+        :param position: The candidate's position.
+        :type position: str
+
+        :param name: The candidate's name.
+        :type name: str
+        """
+        self.add_rule({"op": "delete", "position": position, "name": name})
+
+    def rename(self, position, name, new_name):
+        """Counts a candidate's votes under a new name.
+
+        :param position: The candidate's position.
+        :type position: str
+
+        :param name: The candidate's current name.
+        :type name: str
+
+        :param new_name: The candidate's new name.
+        :type new_name: str
+
+        :raises ValueError: If ballots cast for new_name count for another
+            candidate or as withdrawn, they would keep doing so.
+        """
+        target = self.target(position, new_name)
+        if target != new_name:
+            raise ValueError(f"Votes for {new_name} count for {target}")
+        self.add_rule({"op": "rename", "position": position, "name": name, "to": new_name})
+
+    def merge(self, position, name, into):
+        """Adds a candidate's votes to another candidate's.
+
+        :param position: The candidates' position.
+        :type position: str
+
+        :param name: The candidate merged away.
+        :type name: str
+
+        :param into: The candidate that keeps both sets of votes.
+        :type into: str
+        """
+        self.add_rule({"op": "merge", "position": position, "name": name, "to": into})
+
+    def restore(self, position, name):
+        """Makes a deleted name count for itself again, with the votes it had
+        when it was deleted, for example when a deleted candidate is added
+        back.
+
+        :param position: The candidate's position.
+        :type position: str
+
+        :param name: The candidate's name.
+        :type name: str
+
+        :raises ValueError: If the name was renamed or merged, its ballots
+            count for another candidate and it can't be reused.
+        """
+        target = self.target(position, name)
+        if target == WITHDRAWN:
+            self.add_rule({"op": "restore", "position": position, "name": name})
+        elif target != name:
+            raise ValueError(f"Votes for {name} count for {target}")
+
+    def target(self, position, code):
+        """The candidate a ballot code counts for now.
+
+        :param position: The position voted for.
+        :type position: str
+
+        :param code: The candidate name on the ballot.
+        :type code: str
+
+        :return: The candidate name, or WITHDRAWN.
+        :rtype: str
+        """
+        return self.mapping.get(position, {}).get(code, code)
+
+    def apply(self, tallies):
+        """Results after the rules, from tallies of ballot codes.
+
+        Takes time proportional to the number of candidates, not ballots.
+
+        :param tallies: A dictionary of position to a Counter of votes per code.
+        :type tallies: dict
+
+        :return: A dictionary of position to a Counter of candidate votes.
+        :rtype: dict
+        """
+        results = {}
+        for position, counts in tallies.items():
+            mapping = self.mapping.get(position, {})
+            results[position] = Counter()
+            for code, count in counts.items():
+                results[position][mapping.get(code, code)] += count
+        return results
+
+def verify_results(directory, results, rules=None):
+    """Compares results with a full rescan of every ballot.
+
+    :param directory: Directory holding the election files.
+    :type directory: str
+
+    :param results: Results to check, after the rules.
+    :type results: dict
+
+    :param rules: Rules to apply to the rescan, defaults to the saved rules.
+    :type rules: CandidateRules
+
+    :return: The positions whose results differ, empty if they all match.
+    :rtype: list
+    """
+    rescan = (rules or CandidateRules.load(directory)).apply(merge_tallies(directory))
+    positions = set(rescan) | set(results)
+    return sorted(position for position in positions
+                  if +Counter(rescan.get(position, {})) != +Counter(results.get(position, {})))
+
+if __name__ == "__main__":
+    # full rescan with the saved rules: python candidate_rules.py [directory]
+    directory = sys.argv[1] if len(sys.argv) > 1 else '.'
+    rules = CandidateRules.load(directory)
+    for position, counts in rules.apply(merge_tallies(directory)).items():
+        print(f"{position}: " + ", ".join(f"{candidate} {count}" for candidate, count in counts.most_common()))
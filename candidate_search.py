@@ -0,0 +1,231 @@
+# most matches a type-ahead list shows, the rest are reached by typing more
+MAX_VISIBLE = 200
+
+# last row of a list cut off at MAX_VISIBLE
+MORE_MATCHES = "... more matches, keep typing"
+
+def sort_key(name):
+    """Order in which candidate names are listed.
+
+    :param name: A candidate name.
+    :type name: str
+
+    :return: The sort key.
+    :rtype: tuple
+    """
+    return (name.casefold(), name)
+
+class TrieNode:
+    """One character step in a PrefixTrie."""
+
+    __slots__ = ("children", "names", "sorted_keys")
+
+    def __init__(self):
+        """Initializes an empty TrieNode."""
+        self.children = {}
+        self.names = []
+        self.sorted_keys = None
+
+class PrefixTrie:
+    """Case-insensitive prefix index over names."""
+
+    def __init__(self):
+        """Initializes an empty PrefixTrie."""
+        self.root = TrieNode()
+        self.size = 0
+
+    def add(self, name):
+        """Adds a name to the index.
+
+        :param name: The name to add.
+        :type name: str
+        """
+        node = self.root
+        for char in name.casefold():
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = TrieNode()
+                node.sorted_keys = None
+            node = child
+        node.names.append(name)
+        node.names.sort()
+        self.size += 1
+
+    def remove(self, name):
+        """Removes one occurrence of a name from the index.
+
+        :param name: The name to remove.
+        :type name: str
+
+        :return: True if the name was found and removed, False if not.
+        :rtype: bool
+        """
+        node = self.root
+        for char in name.casefold():
+            node = node.children.get(char)
+            if node is None:
+                return False
+        if name not in node.names:
+            return False
+        node.names.remove(name)
+        self.size -= 1
+        return True
+
+    def search(self, prefix, limit=None):
+        """Names starting with a prefix, in listing order.
+
+        Only the subtree under the prefix is visited, and with a limit only
+        the nodes needed to produce the first matches, so the cost depends on
+        the matches returned, not on how many names are indexed.
+
+        :param prefix: The prefix to match, case-insensitively.
+        :type prefix: str
+
+        :param limit: Most names to return, None for every match.
+        :type limit: int
+
+        :return: A list of matching names.
+        :rtype: list
+        """
+        node = self.root
+        for char in prefix.casefold():
+            node = node.children.get(char)
+            if node is None:
+                return []
+        matches = []
+        stack = [node]
+        while stack and (limit is None or len(matches) < limit):
+            node = stack.pop()
+            matches.extend(node.names if limit is None else node.names[:limit - len(matches)])
+            if node.sorted_keys is None:
+                node.sorted_keys = sorted(node.children)
+            stack.extend(node.children[char] for char in reversed(node.sorted_keys))
+        return matches
+
+class CandidateIndex:
+    """Prefix tries of candidate names, one per position."""
+
+    def __init__(self):
+        """Initializes an empty CandidateIndex."""
+        self.tries = {}
+
+    def add(self, position, name):
+        """Adds a candidate.
+
+        :param position: The candidate's position.
+        :type position: str
+
+        :param name: The candidate's name.
+        :type name: str
+        """
+        if position not in self.tries:
+            self.tries[position] = PrefixTrie()
+        self.tries[position].add(name)
+
+    def remove(self, position, name):
+        """Removes a candidate.
+
+        :param position: The candidate's position.
+        :type position: str
+
+        :param name: The candidate's name.
+        :type name: str
+
+        :return: True if the candidate was found and removed, False if not.
+        :rtype: bool
+        """
+        trie = self.tries.get(position)
+        return trie is not None and trie.remove(name)
+
+    def search(self, position, prefix, limit=None):
+        """Candidates for a position whose names start with a prefix.
+
+        :param position: The position to search.
+        :type position: str
+
+        :param prefix: The prefix to match, case-insensitively.
+        :type prefix: str
+
+        :param limit: Most names to return, None for every match.
+        :type limit: int
+
+        :return: A list of matching names in listing order.
+        :rtype: list
+        """
+        trie = self.tries.get(position)
+        return trie.search(prefix, limit) if trie is not None else []
+
+def show_matches(listbox, shown, index, position, prefix):
+    """Shows the first MAX_VISIBLE candidates starting with a prefix, and a
+    MORE_MATCHES row if there are more.
+
+    Only the matches shown are searched for and compared, so a keystroke
+    costs the same however many candidates match.
+
+    :param listbox: The listbox to update.
+    :type listbox: tk.Listbox
+
+    :param shown: The names currently in the listbox, updated in place.
+    :type shown: list
+
+    :param index: The candidates.
+    :type index: CandidateIndex
+
+    :param position: The position the listbox lists.
+    :type position: str
+
+    :param prefix: The search text.
+    :type prefix: str
+    """
+    matches = index.search(position, prefix, MAX_VISIBLE + 1)
+    sync_listbox(listbox, shown, matches[:MAX_VISIBLE], more=len(matches) > MAX_VISIBLE)
+
+def sync_listbox(listbox, shown, wanted, more=False):
+    """Updates a listbox to show new items by inserting and deleting only
+    the rows that differ.
+
+    Both lists must be in listing order. Rows that stay keep their
+    selection.
+
+    :param listbox: The listbox to update.
+    :type listbox: tk.Listbox
+
+    :param shown: The items currently in the listbox, updated in place.
+    :type shown: list
+
+    :param wanted: The items the listbox should show.
+    :type wanted: list
+
+    :param more: Whether to end the list with a MORE_MATCHES row.
+    :type more: bool
+    """
+    # the MORE_MATCHES row is not in shown, drop it before comparing
+    if listbox.size() > len(shown):
+        listbox.delete(len(shown), "end")
+    i = j = 0
+    while i < len(shown) or j < len(wanted):
+        if i < len(shown) and j < len(wanted) and shown[i] == wanted[j]:
+            i += 1
+            j += 1
+            continue
+        # rows before index j already match wanted[:j]
+        deletes = i
+        while deletes < len(shown) and (j >= len(wanted) or sort_key(shown[deletes]) < sort_key(wanted[j])):
+            deletes += 1
+        if deletes > i:
+            listbox.delete(j, j + deletes - i - 1)
+            i = deletes
+            continue
+        inserts = j
+        while inserts < len(wanted) and (i >= len(shown) or sort_key(wanted[inserts]) < sort_key(shown[i])):
+            inserts += 1
+        if inserts == j:
+            # equal keys but different rows, replace one
+            listbox.delete(j)
+            i += 1
+            inserts = j + 1
+        listbox.insert(j, *wanted[j:inserts])
+        j = inserts
+    shown[:] = wanted
+    if more:
+        listbox.insert("end", MORE_MATCHES)
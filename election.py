@@ -1,17 +1,20 @@
 import csv
+import os
+from candidate_rules import CandidateRules
+from election_host import DEFAULT_POSITIONS
 
 class Election:
     """Class to define the election"""
     
-    def __init__(self):
-        """Initialize an Election object."""
-        
-        self.candidates_by_position = {
-            "President": [],
-            "Vice-President": [],
-            "Secretary": [],
-            "Treasurer": []
-        }
+    def __init__(self, positions=None, directory='.'):
+        """Initialize an Election object.
+
+        :param positions: Positions on the ballot, defaults to the standard four.
+        :param directory: Directory holding the election files.
+        """
+        self.directory = directory
+        self.candidate_rules = CandidateRules.load(directory)
+        self.candidates_by_position = {position: [] for position in (positions or DEFAULT_POSITIONS)}
 
     def add_candidate(self, candidate):
         """Add a candidate to the election.
@@ -19,7 +22,7 @@ class Election:
         :param candidate: A Candidate object to be added to the election.
         """
         position = candidate.position
-        self.candidates_by_position[position].append(candidate)
+        self.candidates_by_position.setdefault(position, []).append(candidate)
 
     def vote(self, candidate_index):
         """define candidate vote using index's.
@@ -44,7 +47,7 @@ class Election:
             print("Invalid candidate index.")
 
     def remove_candidate_by_name(self, candidate_name):
-        """Remove a candidate by their name.
+        """Remove a candidate by their name, moving their votes to the withdrawn bucket.
 
         :param candidate_name: The name of the candidate to be removed.
         :return: True if the candidate was found and removed, False if not.
@@ -53,6 +56,7 @@ class Election:
             for candidate in candidates:
                 if candidate.name == candidate_name:
                     self.candidates_by_position[position].remove(candidate)
+                    self.candidate_rules.delete(position, candidate_name)
                     return True
         return False
 
@@ -77,7 +81,7 @@ class Election:
     def load_candidates_from_file(self):
         """Load candidates from the CSV file."""
         try:
-            with open('candidates.csv', 'r') as file:
+            with open(os.path.join(self.directory, 'candidates.csv'), 'r') as file:
                 reader = csv.reader(file)
                 for row in reader:
                     position, candidate_name = row
@@ -89,11 +93,12 @@ class Election:
     def save_candidates_to_file(self):
         """Save candidates to the CSV file.
         """
-        with open('candidates.csv', 'w', newline='') as file:
+        with open(os.path.join(self.directory, 'candidates.csv'), 'w', newline='') as file:
             writer = csv.writer(file)
             for position, candidates in self.candidates_by_position.items():
                 for candidate in candidates:
                     writer.writerow([position, candidate.name])
+        self.candidate_rules.save(self.directory)
                     
 class Candidate:
     """Candidate for the election"""
@@ -0,0 +1,219 @@
+import json
+import os
+import sys
+import threading
+import time
+from ballot_store import BallotStore
+from snapshot import ElectionSnapshot
+from voter_roll import VoterRoll
+
+# each election keeps its files in its own directory under this one
+ELECTIONS_ROOT = 'elections'
+
+# per-election settings, kept in the election's directory
+ELECTION_CONFIG = 'election.json'
+
+# compressed ballots, roll and results of a closed election, see archive.py
+CLOSED_ARCHIVE = 'election.archive'
+
+# positions of an election without a config, such as the working directory
+DEFAULT_POSITIONS = ["President", "Vice-President", "Secretary", "Treasurer"]
+
+# seconds an election may go unused before its state is dropped
+IDLE_SECONDS = 600
+
+def election_directory(election_id, root=ELECTIONS_ROOT):
+    """Directory holding one election's files.
+
+    :param election_id: The election's ID.
+    :type election_id: str
+
+    :param root: Directory holding all elections.
+    :type root: str
+
+    :return: The election directory.
+    :rtype: str
+    """
+    return os.path.join(root, election_id)
+
+def read_positions(directory='.'):
+    """Positions on an election's ballot, in ballot order.
+
+    :param directory: Directory holding the election files.
+    :type directory: str
+
+    :return: A list of position names.
+    :rtype: list
+    """
+    try:
+        with open(os.path.join(directory, ELECTION_CONFIG), 'r') as file:
+            return json.load(file)["positions"]
+    except FileNotFoundError:
+        return list(DEFAULT_POSITIONS)
+
+def create_election(election_id, positions, root=ELECTIONS_ROOT):
+    """Creates an election directory with its positions.
+
+    :param election_id: The election's ID.
+    :type election_id: str
+
+    :param positions: Positions on the ballot, in ballot order.
+    :type positions: list
+
+    :return: The election directory.
+    :rtype: str
+    """
+    directory = election_directory(election_id, root)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ELECTION_CONFIG), 'w') as file:
+        json.dump({"positions": list(positions)}, file, indent=2)
+    return directory
+
+def list_elections(root=ELECTIONS_ROOT, include_closed=False):
+    """IDs of the elections under a root directory.
+
+    :param root: Directory holding all elections.
+    :type root: str
+
+    :param include_closed: Also list elections that have been archived.
+    :type include_closed: bool
+
+    :return: A sorted list of election IDs.
+    :rtype: list
+    """
+    try:
+        names = os.listdir(root)
+    except FileNotFoundError:
+        return []
+    return sorted(name for name in names if os.path.exists(os.path.join(root, name, ELECTION_CONFIG))
+                  and (include_closed or not os.path.exists(os.path.join(root, name, CLOSED_ARCHIVE))))
+
+class ElectionPartition:
+    """One election's positions, snapshot, voter roll and ballot shard.
+
+    Everything is read from and written to the election's own directory,
+    so elections served by one process never share a file.
+    """
+
+    def __init__(self, directory='.', kiosk_id=None, election_id=None):
+        """Loads an election.
+
+        :param directory: Directory holding the election files.
+        :type directory: str
+
+        :param kiosk_id: ID recorded on ballots cast through this partition.
+        :type kiosk_id: str
+
+        :param election_id: The election's ID, None for the working directory.
+        :type election_id: str
+        """
+        self.election_id = election_id
+        self.directory = directory
+        self.positions = read_positions(directory)
+        self.snapshot = ElectionSnapshot.load(directory)
+        self.voter_roll = VoterRoll(os.path.join(directory, 'voters.csv'))
+        self.ballot_store = BallotStore(directory, kiosk_id)
+        self.last_used = time.monotonic()
+
+    def marker_path(self, login_id):
+        """Path of the marker file written when a voter has voted.
+
+        :param login_id: The voter's login ID.
+        :type login_id: str
+
+        :return: The marker path.
+        :rtype: str
+        """
+        return os.path.join(self.directory, f'voter_{login_id}.txt')
+
+    def close(self):
+        """Closes the active ballot shard."""
+        self.ballot_store.close()
+
+class ElectionHost:
+    """Serves many elections from one process.
+
+    An election is loaded the first time it is asked for and dropped again
+    once it has not been used for a while, so memory follows the elections
+    that are actually voting.
+    """
+
+    def __init__(self, root=ELECTIONS_ROOT, kiosk_id=None, idle_seconds=IDLE_SECONDS):
+        """Initializes an ElectionHost.
+
+        :param root: Directory holding all elections.
+        :type root: str
+
+        :param kiosk_id: ID recorded on ballots cast through this host.
+        :type kiosk_id: str
+
+        :param idle_seconds: Seconds an election may go unused before it is dropped.
+        :type idle_seconds: float
+        """
+        self.root = root
+        self.kiosk_id = kiosk_id
+        self.idle_seconds = idle_seconds
+        self.partitions = {}
+        self.lock = threading.Lock()
+
+    def election_ids(self):
+        """IDs of the elections this host can serve.
+
+        :return: A sorted list of election IDs.
+        :rtype: list
+        """
+        return list_elections(self.root)
+
+    def get(self, election_id):
+        """An election's partition, loading it if needed.
+
+        :param election_id: The election's ID.
+        :type election_id: str
+
+        :return: The partition.
+        :rtype: ElectionPartition
+        """
+        if election_id not in self.election_ids():
+            raise KeyError(election_id)
+        self.evict_idle()
+        with self.lock:
+            partition = self.partitions.get(election_id)
+            if partition is None:
+                partition = ElectionPartition(election_directory(election_id, self.root), self.kiosk_id, election_id)
+                self.partitions[election_id] = partition
+            partition.last_used = time.monotonic()
+            return partition
+
+    def evict_idle(self):
+        """Closes and drops the elections that have been idle too long.
+
+        :return: The IDs of the dropped elections.
+        :rtype: list
+        """
+        now = time.monotonic()
+        with self.lock:
+            idle = [election_id for election_id, partition in self.partitions.items()
+                    if now - partition.last_used > self.idle_seconds]
+            for election_id in idle:
+                self.partitions.pop(election_id).close()
+        return idle
+
+    def close(self):
+        """Closes every loaded election."""
+        with self.lock:
+            for partition in self.partitions.values():
+                partition.close()
+            self.partitions.clear()
+
+if __name__ == "__main__":
+    # python election_host.py create <election id> <position> [position ...]
+    # python election_host.py list
+    if len(sys.argv) > 3 and sys.argv[1] == "create":
+        print(f"Created {create_election(sys.argv[2], sys.argv[3:])}")
+    elif len(sys.argv) > 1 and sys.argv[1] == "list":
+        for election_id in list_elections(include_closed=True):
+            directory = election_directory(election_id)
+            closed = " (closed)" if os.path.exists(os.path.join(directory, CLOSED_ARCHIVE)) else ""
+            print(f"{election_id}{closed}: {', '.join(read_positions(directory))}")
+    else:
+        print("usage: python election_host.py create <election id> <position> [position ...] | list")
@@ -2,7 +2,10 @@ import tkinter as tk
 from tkinter import messagebox
 from admin_app import AdminApp
 from voter_app import VoterApp
-import csv
+from voter_roll import VoterRoll
+from election_host import ElectionHost, election_directory, list_elections
+import os
+import sys
 
 class User:
     """Represents a user in the login system."""
@@ -44,13 +47,17 @@ class Voter(User):
 class VoterLoginScreen:
     """UI for the voter login screen."""
     
-    def __init__(self, master):
+    def __init__(self, master, directory='.'):
         """Initializes the VoterLoginScreen.
 
         :param master: The main voter login window.
         :type master: tk.Tk
+
+        :param directory: Directory holding the election files.
+        :type directory: str
         """
         self.master = master
+        self.directory = directory
         self.master.title("Voter Login")
 
         width = 300
@@ -87,7 +94,7 @@ class VoterLoginScreen:
         if self.verify_voter(name, voter_id):
             voter_user = Voter(name)
             self.master.destroy()
-            voter_app = VoterApp(voter_user)
+            voter_app = VoterApp(voter_user, directory=self.directory)
             voter_app.mainloop()
         else:
             messagebox.showerror("Error", "Invalid Name or Voter ID")
@@ -104,12 +111,7 @@ class VoterLoginScreen:
         :return: True if the credentials are valid, False if not.
         :rtype: bool
         """
-        with open("voters.csv", newline="") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                if row["Name"] == name and row["VoterID"] == voter_id:
-                    return True
-        return False
+        return VoterRoll(os.path.join(self.directory, 'voters.csv')).verify_voter(name, voter_id)
 
     def run(self):
         """Runs the VoterLoginScreen."""
@@ -118,13 +120,21 @@ class VoterLoginScreen:
 class AdminLoginScreen:
     """UI for the admin login screen."""
     
-    def __init__(self, master):
+    def __init__(self, master, replica_directory=None, directory='.'):
         """Initializes the AdminLoginScreen.
 
         :param master: The main admin login window.
         :type master: tk.Tk
+
+        :param replica_directory: Replica for the admin app to read results from.
+        :type replica_directory: str
+
+        :param directory: Directory holding the election files.
+        :type directory: str
         """
         self.master = master
+        self.replica_directory = replica_directory
+        self.directory = directory
         self.master.title("Admin Login")
 
         width = 300
@@ -164,7 +174,7 @@ class AdminLoginScreen:
         if username == "admin" and password == "adminpass":
             admin_user = Admin(username)
             self.master.destroy()
-            admin_app = AdminApp(admin_user)
+            admin_app = AdminApp(admin_user, self.replica_directory, self.directory)
             admin_app.mainloop()
         else:
             messagebox.showerror("Login Failed", "Invalid admin credentials")
@@ -173,16 +183,124 @@ class AdminLoginScreen:
         """Runs the AdminLoginScreen."""
         self.master.mainloop()
 
+class KioskApp(VoterApp):
+    """Voter kiosk that keeps one Tk root and ballot alive across voters."""
+
+    def __init__(self, kiosk_id=None, return_delay=3000, directory='.', host=None):
+        """Initializes the KioskApp.
+
+        :param kiosk_id: ID recorded on ballots cast at this kiosk.
+        :type kiosk_id: str
+
+        :param return_delay: Milliseconds to show the confirmation before
+            returning to the login screen.
+        :type return_delay: int
+
+        :param directory: Directory holding the election files, when serving
+            a single election.
+        :type directory: str
+
+        :param host: If given, the kiosk serves every election of this host
+            and voters pick theirs at login.
+        :type host: ElectionHost
+        """
+        self.host = host
+        partition = host.get(host.election_ids()[0]) if host is not None else None
+        super().__init__(kiosk_id=kiosk_id, directory=directory, partition=partition)
+        self.return_delay = return_delay
+
+        # login frame
+        self.login_frame = tk.Frame(self)
+
+        if host is not None:
+            self.label_election = tk.Label(self.login_frame, text="Election:")
+            self.label_election.pack()
+
+            election_ids = host.election_ids()
+            self.selected_election = tk.StringVar(self.login_frame)
+            self.selected_election.set(election_ids[0])
+            self.election_dropdown = tk.OptionMenu(self.login_frame, self.selected_election, *election_ids)
+            self.election_dropdown.pack()
+
+        self.label_name = tk.Label(self.login_frame, text="Name:")
+        self.label_name.pack()
+
+        self.entry_name = tk.Entry(self.login_frame)
+        self.entry_name.pack()
+
+        self.label_voter_id = tk.Label(self.login_frame, text="Voter ID:")
+        self.label_voter_id.pack()
+
+        self.entry_voter_id = tk.Entry(self.login_frame)
+        self.entry_voter_id.pack()
+
+        self.login_button = tk.Button(self.login_frame, text="Login", command=self.login)
+        self.login_button.pack()
+
+        self.entry_name.bind('<Return>', lambda event=None: self.login())
+        self.entry_voter_id.bind('<Return>', lambda event=None: self.login())
+
+        self.show_login()
+
+    def destroy(self):
+        """Closes every election this kiosk has open and the window."""
+        if self.host is not None:
+            self.host.close()
+        super().destroy()
+
+    def show_login(self):
+        """Hides the ballot and shows an empty login form for the next voter."""
+        self.ballot_frame.pack_forget()
+        self.voter_user = None
+        self.title("Voter Login")
+        self.entry_name.delete(0, tk.END)
+        self.entry_voter_id.delete(0, tk.END)
+        self.login_frame.pack(expand=True)
+        self.entry_name.focus_set()
+
+    def login(self):
+        """Verifies the voter and swaps the login form for the ballot."""
+        name = self.entry_name.get()
+        voter_id = self.entry_voter_id.get()
+        partition = self.partition
+        if self.host is not None:
+            partition = self.host.get(self.selected_election.get())
+        if not partition.voter_roll.verify_voter(name, voter_id):
+            messagebox.showerror("Error", "Invalid Name or Voter ID")
+            return
+        if partition is not self.partition:
+            self.open_election(partition)
+        self.login_frame.pack_forget()
+        self.start_session(Voter(name))
+        self.ballot_frame.pack(expand=True, fill=tk.BOTH)
+        if self.has_voted():
+            self.display_status("Voter has already voted.", "red")
+            self.vote_button.config(state=tk.DISABLED)
+            self.after(self.return_delay, self.show_login)
+
+    def on_vote_submitted(self):
+        """Returns to the login screen after the confirmation has been shown."""
+        self.vote_button.config(state=tk.DISABLED)
+        self.after(self.return_delay, self.show_login)
+
 class LoginScreen:
     """UI for the main login screen."""
     
-    def __init__(self, master):
+    def __init__(self, master, replica_directory=None, directory='.'):
         """Initializes the LoginScreen.
 
         :param master: The main login window.
         :type master: tk.Tk
+
+        :param replica_directory: Replica for the admin app to read results from.
+        :type replica_directory: str
+
+        :param directory: Directory holding the election files.
+        :type directory: str
         """
         self.master = master
+        self.replica_directory = replica_directory
+        self.directory = directory
         self.admin_login = None
         self.master.title("Login")
 
@@ -210,16 +328,33 @@ class LoginScreen:
     def open_voter_login(self):
         """Opens the voter login screen."""
         self.master.withdraw()
-        voter_login_screen = VoterLoginScreen(tk.Toplevel(self.master))
+        voter_login_screen = VoterLoginScreen(tk.Toplevel(self.master), self.directory)
         voter_login_screen.run()
 
     def open_admin_login(self):
         """Opens the admin login screen."""
         self.master.withdraw()
-        admin_login_screen = AdminLoginScreen(tk.Toplevel(self.master))
+        admin_login_screen = AdminLoginScreen(tk.Toplevel(self.master), self.replica_directory, self.directory)
         admin_login_screen.run()
 
 if __name__ == "__main__":
-    root = tk.Tk()
-    login_screen = LoginScreen(root)
-    root.mainloop()
+    # optional election ID follows --election, its files are in elections/<id>
+    election_args = sys.argv[sys.argv.index("--election") + 1:] if "--election" in sys.argv else []
+    directory = election_directory(election_args[0]) if election_args else '.'
+    if "--kiosk" in sys.argv[1:]:
+        # optional kiosk ID follows the flag
+        kiosk_args = sys.argv[sys.argv.index("--kiosk") + 1:]
+        kiosk_id = kiosk_args[0] if kiosk_args and not kiosk_args[0].startswith("--") else None
+        # without --election a kiosk serves every election under elections/
+        host = ElectionHost(kiosk_id=kiosk_id) if not election_args and list_elections() else None
+        kiosk_app = KioskApp(kiosk_id, directory=directory, host=host)
+        kiosk_app.mainloop()
+    else:
+        # optional replica directory for admin reads follows --replica
+        replica_args = sys.argv[sys.argv.index("--replica") + 1:] if "--replica" in sys.argv else []
+        replica_directory = replica_args[0] if replica_args else None
+        if replica_directory is not None and election_args:
+            replica_directory = os.path.join(replica_directory, election_args[0])
+        root = tk.Tk()
+        login_screen = LoginScreen(root, replica_directory, directory)
+        root.mainloop()
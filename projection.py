@@ -0,0 +1,194 @@
+import json
+import math
+import os
+import random
+from collections import Counter
+
+# z score for a 95% confidence interval
+Z_95 = 1.96
+
+# records are accepted with probability REFERENCE_RECORD_BYTES / record length,
+# which cancels the bias of landing on long records more often
+REFERENCE_RECORD_BYTES = 64
+
+# bytes read on each side of a random offset to find the enclosing record
+WINDOW_BYTES = 4096
+
+class BallotSampler:
+    """Uniform random sample of ballots drawn by seeking to random offsets.
+
+    The cost of a draw depends on the record size, not on how many ballots
+    the logs hold, so a sample of fixed size takes the same time for any
+    election.
+    """
+
+    def __init__(self, paths, rng=None):
+        """Initializes a BallotSampler.
+
+        :param paths: Paths to ballot logs to sample from.
+        :type paths: list
+
+        :param rng: Random number generator, mainly for repeatable samples.
+        :type rng: random.Random
+        """
+        self.files = []
+        self.total_bytes = 0
+        for path in paths:
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                continue
+            if size:
+                self.files.append((path, self.total_bytes, size))
+                self.total_bytes += size
+        self.rng = rng or random.Random()
+        self.accepted = 0
+        self.accepted_bytes = 0
+
+    def estimated_count(self):
+        """Estimates the number of ballots from the mean sampled record size.
+
+        :return: The estimated ballot count, or 0 before anything was sampled.
+        :rtype: int
+        """
+        if not self.accepted:
+            return 0
+        return round(self.total_bytes * self.accepted / self.accepted_bytes)
+
+    def sample(self, k, max_attempts_per_ballot=50):
+        """Draws k ballots uniformly at random, with replacement.
+
+        :param k: Number of ballots to draw.
+        :type k: int
+
+        :param max_attempts_per_ballot: Gives up after k times this many
+            rejected draws, for logs that hold no readable records.
+        :type max_attempts_per_ballot: int
+
+        :return: A list of ballot records, shorter than k only if the logs
+            are empty or unreadable.
+        :rtype: list
+        """
+        ballots = []
+        if not self.files:
+            return ballots
+        handles = {}
+        try:
+            attempts = 0
+            while len(ballots) < k and attempts < k * max_attempts_per_ballot:
+                attempts += 1
+                ballot = self._draw(handles)
+                if ballot is not None:
+                    ballots.append(ballot)
+        finally:
+            for handle in handles.values():
+                handle.close()
+        return ballots
+
+    def _draw(self, handles):
+        """Reads the record enclosing one random byte offset.
+
+        :param handles: Open log files keyed by path, filled in on demand.
+        :type handles: dict
+
+        :return: The ballot record, or None if the draw was rejected.
+        :rtype: dict
+        """
+        offset = self.rng.randrange(self.total_bytes)
+        for path, file_start, size in self.files:
+            if offset < file_start + size:
+                break
+        offset -= file_start
+        if path not in handles:
+            handles[path] = open(path, 'rb')
+        handle = handles[path]
+        start = max(0, offset - WINDOW_BYTES)
+        handle.seek(start)
+        data = handle.read(offset - start + WINDOW_BYTES)
+        relative = offset - start
+        line_start = data.rfind(b"\n", 0, relative) + 1
+        line_end = data.find(b"\n", relative)
+        if (line_start == 0 and start > 0) or line_end == -1:
+            # record longer than the window, or a write still in progress
+            return None
+        length = line_end + 1 - line_start
+        if self.rng.random() * length > REFERENCE_RECORD_BYTES:
+            return None
+        try:
+            ballot = json.loads(data[line_start:line_end])
+        except ValueError:
+            return None
+        self.accepted += 1
+        self.accepted_bytes += length
+        return ballot
+
+class Projection:
+    """Vote shares per position estimated from a growing ballot sample."""
+
+    def __init__(self, sampler, rules=None):
+        """Initializes a Projection.
+
+        :param sampler: Source of randomly sampled ballots.
+        :type sampler: BallotSampler
+
+        :param rules: Candidate deletes, renames and merges to apply to the
+            sampled counts.
+        :type rules: CandidateRules
+        """
+        self.sampler = sampler
+        self.rules = rules
+        self.counts = {}
+        self.sampled = 0
+
+    def extend(self, k):
+        """Samples more ballots, tightening the estimate.
+
+        :param k: Number of ballots to add to the sample.
+        :type k: int
+
+        :return: Number of ballots actually added.
+        :rtype: int
+        """
+        ballots = self.sampler.sample(k)
+        for ballot in ballots:
+            for position, candidate in ballot["choices"].items():
+                if position not in self.counts:
+                    self.counts[position] = Counter()
+                self.counts[position][candidate] += 1
+        self.sampled += len(ballots)
+        return len(ballots)
+
+    def shares(self, z=Z_95):
+        """Projected vote share and margin of error for every candidate.
+
+        Margins use the normal approximation to the binomial.
+
+        :param z: z score of the confidence level.
+        :type z: float
+
+        :return: A dictionary of position to a list of (candidate, share,
+            margin) tuples, highest share first.
+        :rtype: dict
+        """
+        results = {}
+        counts = self.rules.apply(self.counts) if self.rules is not None else self.counts
+        for position, candidate_counts in counts.items():
+            n = sum(candidate_counts.values())
+            results[position] = []
+            for candidate, count in candidate_counts.most_common():
+                share = count / n
+                margin = z * math.sqrt(share * (1 - share) / n)
+                results[position].append((candidate, share, margin))
+        return results
+
+    def max_margin(self, z=Z_95):
+        """Widest margin of error across all candidates.
+
+        :param z: z score of the confidence level.
+        :type z: float
+
+        :return: The widest margin, or 1.0 before anything was sampled.
+        :rtype: float
+        """
+        margins = [margin for shares in self.shares(z).values() for _, _, margin in shares]
+        return max(margins) if margins else 1.0
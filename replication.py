@@ -0,0 +1,351 @@
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+from ballot_store import (ARCHIVE_LOG, add_tallies, base_tallies, is_shard, is_voted_journal,
+                          load_archive_state, shard_stem, write_archive_state)
+
+REPLICATION_PORT = 8765
+
+# seconds between scans of the primary's vote files
+POLL_INTERVAL = 0.2
+
+# tallies and lag metrics written by the replica for other processes
+REPLICA_STATE = 'replica-state.json'
+
+def log_stem(file_name):
+    """Name that identifies a shard or voted journal across renames.
+
+    :param file_name: The file name.
+    :type file_name: str
+
+    :return: The stem.
+    :rtype: str
+    """
+    return shard_stem(file_name) if is_shard(file_name) else file_name[:-len(".jsonl")]
+
+# stem of the compacted ballot log, replicated up to the size its tallies cover
+ARCHIVE_STEM = log_stem(ARCHIVE_LOG)
+
+class ReplicationServer:
+    """Streams committed ballots and voted records from a primary directory.
+
+    The server only reads the append-only logs the kiosks write, so it takes
+    no lock on the vote path. Each replica gets every record once, in log
+    order, starting from the offsets it reports when it connects. After
+    each compaction the new part of the archive log is sent, followed by
+    the archive tallies and the shards that were folded into it.
+    """
+
+    def __init__(self, directory='.', host='127.0.0.1', port=REPLICATION_PORT, poll_interval=POLL_INTERVAL):
+        """Initializes a ReplicationServer.
+
+        :param directory: Primary directory holding the vote files.
+        :type directory: str
+
+        :param host: Address to listen on.
+        :type host: str
+
+        :param port: Port to listen on.
+        :type port: int
+
+        :param poll_interval: Seconds between scans of the vote files.
+        :type poll_interval: float
+        """
+        self.directory = directory
+        self.host = host
+        self.port = port
+        self.poll_interval = poll_interval
+
+    def serve_forever(self):
+        """Accepts replicas and streams to each one on its own thread."""
+        with socket.create_server((self.host, self.port)) as server:
+            while True:
+                connection, _ = server.accept()
+                threading.Thread(target=self.stream, args=(connection,), daemon=True).start()
+
+    def stream(self, connection):
+        """Sends records to one replica until it disconnects.
+
+        :param connection: The replica's connection.
+        :type connection: socket.socket
+        """
+        with connection, connection.makefile('rb') as reader:
+            covered = json.loads(reader.readline()).get("covered", {})
+            archive_bytes = None
+            try:
+                while True:
+                    state = load_archive_state(self.directory)
+                    archived = set(state.get("archived", []))
+                    if state["archive_bytes"] != archive_bytes:
+                        archive_bytes = state["archive_bytes"]
+                        self.send_new_records(connection, ARCHIVE_LOG, covered, archive_bytes)
+                        self.send(connection, {
+                            "type": "base",
+                            "tallies": {position: dict(counts) for position, counts in base_tallies(self.directory).items()},
+                            "archive_tallies": state["tallies"],
+                            "archived": state.get("archived", []),
+                        })
+                    for name in sorted(os.listdir(self.directory)):
+                        if (is_shard(name) and shard_stem(name) not in archived) or is_voted_journal(name):
+                            self.send_new_records(connection, name, covered)
+                    self.send(connection, {"type": "heartbeat", "time": time.time()})
+                    time.sleep(self.poll_interval)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    def send_new_records(self, connection, name, covered, end=None):
+        """Sends the complete lines appended to one log since the last scan.
+
+        :param connection: The replica's connection.
+        :type connection: socket.socket
+
+        :param name: File name of the shard, voted journal or archive log.
+        :type name: str
+
+        :param covered: Log stem to byte offset already sent, updated in place.
+        :type covered: dict
+
+        :param end: Byte offset to stop at, defaults to the end of the log.
+        :type end: int
+        """
+        stem = log_stem(name)
+        offset = covered.get(stem, 0)
+        messages = []
+        try:
+            with open(os.path.join(self.directory, name), 'rb') as log:
+                log.seek(offset)
+                for line in log:
+                    if not line.endswith(b"\n") or (end is not None and offset + len(line) > end):
+                        break
+                    offset += len(line)
+                    messages.append({"type": "record", "stem": stem, "end": offset, "line": line.decode("utf-8")})
+        except FileNotFoundError:
+            # closed or folded between listing and opening, picked up next scan
+            return
+        for message in messages:
+            self.send(connection, message)
+        covered[stem] = offset
+
+    def send(self, connection, message):
+        """Sends one newline-delimited JSON message.
+
+        :param connection: The replica's connection.
+        :type connection: socket.socket
+
+        :param message: The message to send.
+        :type message: dict
+        """
+        connection.sendall((json.dumps(message) + "\n").encode("utf-8"))
+
+class Replica:
+    """Read-only copy of the vote logs with its own tallies.
+
+    Records are appended byte for byte to copies of the primary's logs, so
+    the copies' sizes are the replica's position and the ballot_store
+    readers work on the replica directory. That includes the archive log:
+    once the primary folds shards into it, the replica's copies of those
+    shards are folded and removed the same way compaction does.
+    """
+
+    def __init__(self, directory):
+        """Initializes a Replica, recovering its position from its copies.
+
+        :param directory: Replica directory.
+        :type directory: str
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.covered = {}
+        self.stem_tallies = {}
+        self.voted = set()
+        self.base = {"tallies": {}, "archived": []}
+        self.metrics = {"commit_lag": 0.0, "stream_delay": 0.0, "last_heartbeat": 0.0, "applied": 0}
+        try:
+            with open(os.path.join(directory, REPLICA_STATE), 'r') as file:
+                self.base = json.load(file)["base"]
+        except FileNotFoundError:
+            pass
+        for name in os.listdir(directory):
+            if is_shard(name) or is_voted_journal(name) or name == ARCHIVE_LOG:
+                self.recover(name)
+
+    def recover(self, name):
+        """Drops a partial trailing line from a copy and re-applies the rest.
+
+        :param name: File name of the copy.
+        :type name: str
+        """
+        path = os.path.join(self.directory, name)
+        offset = 0
+        with open(path, 'r+b') as log:
+            for line in log:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                self.apply_record(log_stem(name), json.loads(line))
+            log.truncate(offset)
+        self.covered[log_stem(name)] = offset
+
+    def apply_record(self, stem, record):
+        """Updates the tallies or voted set with one record.
+
+        :param stem: Stem of the log the record came from.
+        :type stem: str
+
+        :param record: A ballot or voted record.
+        :type record: dict
+        """
+        if stem == ARCHIVE_STEM:
+            # counted in the archive tallies sent with the base
+            return
+        if "choices" in record:
+            tallies = self.stem_tallies.setdefault(stem, {})
+            for position, candidate in record["choices"].items():
+                tallies.setdefault(position, Counter())[candidate] += 1
+        else:
+            self.voted.add(record["login_id"])
+
+    def apply(self, message):
+        """Applies one message from the primary, in stream order.
+
+        :param message: The message.
+        :type message: dict
+        """
+        if message["type"] == "record":
+            stem = message["stem"]
+            with open(os.path.join(self.directory, f"{stem}.jsonl"), 'a', encoding="utf-8", newline="") as log:
+                log.write(message["line"])
+            record = json.loads(message["line"])
+            self.apply_record(stem, record)
+            self.covered[stem] = message["end"]
+            self.metrics["applied"] += 1
+            if "choices" in record and stem != ARCHIVE_STEM:
+                self.metrics["commit_lag"] = time.time() - record["ts"]
+        elif message["type"] == "base":
+            self.base = {"tallies": message["tallies"], "archived": message["archived"]}
+            self.fold_archived(message["archive_tallies"])
+        elif message["type"] == "heartbeat":
+            now = time.time()
+            self.metrics["stream_delay"] = now - message["time"]
+            self.metrics["last_heartbeat"] = now
+            self.save()
+
+    def fold_archived(self, archive_tallies):
+        """Writes the archive state for the copied archive log and removes
+        the copies of shards the primary has archived.
+
+        Like compact, the copies are first recorded as folded so readers
+        skip them even if removing them is interrupted.
+
+        :param archive_tallies: Tallies of the primary's archive log.
+        :type archive_tallies: dict
+        """
+        archived = set(self.base["archived"])
+        folded = [f"{stem}.jsonl" for stem in self.covered if stem in archived]
+        state = {
+            "tallies": archive_tallies,
+            "folded": folded,
+            "archived": self.base["archived"],
+            "archive_bytes": self.covered.get(ARCHIVE_STEM, 0),
+            "high_water": {},
+        }
+        write_archive_state(self.directory, state)
+        for name in folded:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            del self.covered[log_stem(name)]
+            self.stem_tallies.pop(log_stem(name), None)
+        state["folded"] = []
+        write_archive_state(self.directory, state)
+
+    def tallies(self):
+        """Results from the primary's archive plus every replicated shard
+        that has not been archived since.
+
+        :return: A dictionary of position to a Counter of candidate votes.
+        :rtype: dict
+        """
+        tallies = add_tallies({}, self.base["tallies"])
+        archived = set(self.base["archived"])
+        for stem, counts in self.stem_tallies.items():
+            if stem not in archived:
+                add_tallies(tallies, counts)
+        return tallies
+
+    def save(self):
+        """Atomically writes the tallies and lag metrics for readers."""
+        path = os.path.join(self.directory, REPLICA_STATE)
+        with open(path + ".tmp", 'w') as file:
+            json.dump({
+                "base": self.base,
+                "tallies": {position: dict(counts) for position, counts in self.tallies().items()},
+                "voted": len(self.voted),
+                "metrics": self.metrics,
+            }, file)
+        os.replace(path + ".tmp", path)
+
+    def run(self, host='127.0.0.1', port=REPLICATION_PORT, retry_interval=1.0):
+        """Follows the primary forever, reconnecting when the stream drops.
+
+        :param host: Address of the replication server.
+        :type host: str
+
+        :param port: Port of the replication server.
+        :type port: int
+
+        :param retry_interval: Seconds to wait before reconnecting.
+        :type retry_interval: float
+        """
+        while True:
+            try:
+                with socket.create_connection((host, port)) as connection, connection.makefile('rb') as reader:
+                    connection.sendall((json.dumps({"covered": self.covered}) + "\n").encode("utf-8"))
+                    for line in reader:
+                        self.apply(json.loads(line))
+            except OSError:
+                pass
+            time.sleep(retry_interval)
+
+def read_replica_state(directory):
+    """Reads the tallies and lag metrics a replica last wrote.
+
+    :param directory: Replica directory.
+    :type directory: str
+
+    :return: A dictionary with "tallies" (position to Counter of candidate
+        votes), "voted" (number of voters) and "metrics" (commit_lag and
+        stream_delay in seconds, last_heartbeat time, applied record count),
+        or None if the replica has not written one yet.
+    :rtype: dict
+    """
+    try:
+        with open(os.path.join(directory, REPLICA_STATE), 'r') as file:
+            state = json.load(file)
+    except FileNotFoundError:
+        return None
+    state["tallies"] = add_tallies({}, state["tallies"])
+    return state
+
+if __name__ == "__main__":
+    # python replication.py serve [primary directory] [--host address] [--port port]
+    # python replication.py follow <replica directory> [--host address] [--port port]
+    # one server per election, each on its own port, replicates several elections at once
+    host_args = sys.argv[sys.argv.index("--host") + 1:] if "--host" in sys.argv else []
+    port_args = sys.argv[sys.argv.index("--port") + 1:] if "--port" in sys.argv else []
+    host = host_args[0] if host_args else '127.0.0.1'
+    port = int(port_args[0]) if port_args else REPLICATION_PORT
+    args = [arg for i, arg in enumerate(sys.argv[1:], 1)
+            if not arg.startswith("--") and sys.argv[i - 1] not in ("--host", "--port")]
+    if args and args[0] == "serve":
+        ReplicationServer(args[1] if len(args) > 1 else '.', host, port).serve_forever()
+    elif len(args) > 1 and args[0] == "follow":
+        Replica(args[1]).run(host, port)
+    else:
+        print("usage: python replication.py serve [primary directory] | follow <replica directory> "
+              "[--host address] [--port port]")
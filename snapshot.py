@@ -0,0 +1,493 @@
+import csv
+import json
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from ballot_store import add_tallies, base_tallies, load_archive_state, tally_shards
+
+SNAPSHOT_FILE = 'election.snapshot'
+
+MAGIC = b"VOTESNAP"
+VERSION = 1
+
+# magic, version, section count
+HEADER = struct.Struct("<8sII")
+# section tag, offset, length
+SECTION = struct.Struct("<4sQQ")
+
+# separates name and ID in voter index keys
+KEY_SEPARATOR = "\x1f"
+
+class SortedStrings:
+    """Sorted strings packed into one buffer with an offset table.
+
+    Decoding does not copy anything on little-endian machines; membership
+    is a binary search over the buffer, so no per-string objects are built
+    until they are read.
+    """
+
+    def __init__(self, blob=b"", offsets=None):
+        """Initializes a SortedStrings.
+
+        :param blob: The UTF-8 encoded strings, concatenated in sorted order.
+        :type blob: bytes
+
+        :param offsets: Start of every string in blob, plus the blob length.
+        :type offsets: array or memoryview
+        """
+        self.blob = blob
+        self.offsets = offsets if offsets is not None else array("I", [0])
+
+    @classmethod
+    def from_strings(cls, strings):
+        """Packs strings, sorting them by their UTF-8 bytes.
+
+        :param strings: The strings to pack.
+        :type strings: iterable
+
+        :return: A new SortedStrings.
+        :rtype: SortedStrings
+        """
+        encoded = sorted(set(string.encode("utf-8") for string in strings))
+        offsets = array("I", [0])
+        for item in encoded:
+            offsets.append(offsets[-1] + len(item))
+        return cls(b"".join(encoded), offsets)
+
+    def encode(self):
+        """Serializes the strings as a count, the offsets, then the buffer.
+
+        :return: The encoded section.
+        :rtype: bytes
+        """
+        offsets = array("I", self.offsets)
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        return struct.pack("<I", len(self)) + offsets.tobytes() + bytes(self.blob)
+
+    @classmethod
+    def decode(cls, data):
+        """Reads strings written by encode without copying the buffer.
+
+        :param data: The encoded section.
+        :type data: memoryview
+
+        :return: A new SortedStrings.
+        :rtype: SortedStrings
+
+        :raises ValueError: If the section is shorter than its offsets say.
+        """
+        if len(data) < 4:
+            raise ValueError("Corrupt election snapshot")
+        count = struct.unpack_from("<I", data)[0]
+        end = 4 + 4 * (count + 1)
+        if end > len(data) or struct.unpack_from("<I", data, end - 4)[0] != len(data) - end:
+            raise ValueError("Corrupt election snapshot")
+        if sys.byteorder == "big":
+            offsets = array("I")
+            offsets.frombytes(data[4:end])
+            offsets.byteswap()
+        else:
+            offsets = data[4:end].cast("I")
+        return cls(data[end:], offsets)
+
+    def release(self):
+        """Releases the views of a decoded section, so the file under them
+        can be closed."""
+        for part in (self.blob, self.offsets):
+            if isinstance(part, memoryview):
+                part.release()
+
+    def __len__(self):
+        """Number of strings."""
+        return len(self.offsets) - 1
+
+    def item(self, index):
+        """The UTF-8 bytes of one string.
+
+        :param index: Position in sorted order.
+        :type index: int
+
+        :return: The encoded string.
+        :rtype: bytes
+        """
+        return bytes(self.blob[self.offsets[index]:self.offsets[index + 1]])
+
+    def __getitem__(self, index):
+        """One string, decoded."""
+        return self.item(index).decode("utf-8")
+
+    def __contains__(self, string):
+        """Binary search for a string."""
+        key = string.encode("utf-8")
+        index = bisect_left(range(len(self)), key, key=self.item)
+        return index < len(self) and self.item(index) == key
+
+    def __iter__(self):
+        """Strings in sorted order."""
+        for index in range(len(self)):
+            yield self[index]
+
+def read_sections(view):
+    """Finds the sections of a snapshot without copying them.
+
+    :param view: The snapshot file contents.
+    :type view: memoryview
+
+    :return: A dictionary of section tag to a view of its data.
+    :rtype: dict
+
+    :raises ValueError: If the data is not a snapshot of a known version,
+        or is cut short.
+    """
+    if len(view) < HEADER.size:
+        raise ValueError("Unsupported election snapshot")
+    magic, version, count = HEADER.unpack_from(view)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Unsupported election snapshot")
+    if HEADER.size + count * SECTION.size > len(view):
+        raise ValueError("Corrupt election snapshot")
+    sections = {}
+    for i in range(count):
+        tag, offset, length = SECTION.unpack_from(view, HEADER.size + i * SECTION.size)
+        if offset + length > len(view):
+            raise ValueError("Corrupt election snapshot")
+        sections[tag] = view[offset:offset + length]
+    return sections
+
+class ElectionSnapshot:
+    """Whole election state written at checkpoints and read with one read.
+
+    The CSV and JSON files are only used to import state when there is no
+    snapshot and to export it after every checkpoint.
+    """
+
+    def __init__(self, candidates=None, voter_index=None, voted=None, tallies=None, covered=None, archive_bytes=0):
+        """Initializes an ElectionSnapshot.
+
+        :param candidates: (name, position) pairs in registry order.
+        :type candidates: list
+
+        :param voter_index: Voter keys from voter_key, as a SortedStrings.
+        :type voter_index: SortedStrings
+
+        :param voted: Login IDs of voters who have voted, as a SortedStrings.
+        :type voted: SortedStrings
+
+        :param tallies: Position to candidate vote counts at the checkpoint.
+        :type tallies: dict
+
+        :param covered: Shard stem to byte offset included in the tallies.
+        :type covered: dict
+
+        :param archive_bytes: Archive log size included in the tallies.
+        :type archive_bytes: int
+        """
+        self.candidates = candidates or []
+        self.voter_index = voter_index or SortedStrings()
+        self.voted = voted or SortedStrings()
+        self.tallies = tallies or {}
+        self.covered = covered or {}
+        self.archive_bytes = archive_bytes
+
+    @staticmethod
+    def voter_key(name, voter_id):
+        """Key of a voter in the voter index.
+
+        :param name: The voter's name.
+        :type name: str
+
+        :param voter_id: The voter's ID.
+        :type voter_id: str
+
+        :return: The index key.
+        :rtype: str
+        """
+        return f"{name}{KEY_SEPARATOR}{voter_id}"
+
+    def voters(self):
+        """Every registered voter, ordered by name.
+
+        :return: A list of (name, voter_id) pairs.
+        :rtype: list
+        """
+        return [tuple(key.split(KEY_SEPARATOR, 1)) for key in self.voter_index]
+
+    def with_candidates(self, candidates):
+        """Replaces the candidate registry.
+
+        :param candidates: (name, position) pairs in registry order.
+        :type candidates: list
+
+        :return: This snapshot.
+        :rtype: ElectionSnapshot
+        """
+        self.candidates = list(candidates)
+        return self
+
+    def with_voters(self, voters):
+        """Replaces the voter index.
+
+        :param voters: (name, voter_id) pairs.
+        :type voters: iterable
+
+        :return: This snapshot.
+        :rtype: ElectionSnapshot
+        """
+        self.voter_index = SortedStrings.from_strings(self.voter_key(name, voter_id) for name, voter_id in voters)
+        return self
+
+    def refresh_votes(self, directory='.'):
+        """Brings the voted set and tallies up to date with the vote files.
+
+        :param directory: Directory holding the vote files.
+        :type directory: str
+
+        :return: This snapshot.
+        :rtype: ElectionSnapshot
+        """
+        self.voted = SortedStrings.from_strings(
+            name[len("voter_"):-len(".txt")] for name in os.listdir(directory)
+            if name.startswith("voter_") and name.endswith(".txt"))
+        if self.tallies_valid(directory):
+            counts, self.covered = tally_shards(directory, self.covered)
+            tallies = {position: Counter(candidate_counts) for position, candidate_counts in self.tallies.items()}
+        else:
+            counts, self.covered = tally_shards(directory)
+            tallies = base_tallies(directory)
+        self.tallies = add_tallies(tallies, counts)
+        self.archive_bytes = load_archive_state(directory)["archive_bytes"]
+        return self
+
+    def tallies_valid(self, directory='.'):
+        """Checks if the checkpoint tallies can be extended with shard tails.
+
+        They cannot once shards were folded into the archive after the
+        checkpoint, because the archive tallies then overlap them.
+
+        :param directory: Directory holding the vote files.
+        :type directory: str
+
+        :return: True if the tallies can be extended, False if not.
+        :rtype: bool
+        """
+        state = load_archive_state(directory)
+        return state["archive_bytes"] == self.archive_bytes and not state["folded"]
+
+    def current_tallies(self, directory='.'):
+        """Tallies at the checkpoint plus ballots committed since.
+
+        :param directory: Directory holding the vote files.
+        :type directory: str
+
+        :return: A dictionary of position to a Counter of candidate votes.
+        :rtype: dict
+        """
+        if not self.tallies_valid(directory):
+            return add_tallies(base_tallies(directory), tally_shards(directory)[0])
+        tallies = {position: Counter(candidate_counts) for position, candidate_counts in self.tallies.items()}
+        return add_tallies(tallies, tally_shards(directory, self.covered)[0])
+
+    def has_voted(self, login_id, directory='.'):
+        """Checks the voted set, then the marker files written since.
+
+        :param login_id: The voter's login ID.
+        :type login_id: str
+
+        :param directory: Directory holding the vote files.
+        :type directory: str
+
+        :return: True if the voter has voted, False if not.
+        :rtype: bool
+        """
+        if login_id in self.voted:
+            return True
+        try:
+            with open(os.path.join(directory, f'voter_{login_id}.txt'), 'r') as file:
+                return file.read() == 'voted'
+        except FileNotFoundError:
+            return False
+
+    def encode(self):
+        """Serializes the snapshot.
+
+        :return: The snapshot file contents.
+        :rtype: bytes
+        """
+        meta = json.dumps({
+            "candidates": self.candidates,
+            "tallies": {position: dict(counts) for position, counts in self.tallies.items()},
+            "covered": self.covered,
+            "archive_bytes": self.archive_bytes,
+        }).encode("utf-8")
+        sections = [(b"META", meta), (b"VOTR", self.voter_index.encode()), (b"VOTD", self.voted.encode())]
+        offset = HEADER.size + SECTION.size * len(sections)
+        parts = [HEADER.pack(MAGIC, VERSION, len(sections))]
+        for tag, data in sections:
+            parts.append(SECTION.pack(tag, offset, len(data)))
+            offset += len(data)
+        parts.extend(data for _, data in sections)
+        return b"".join(parts)
+
+    @classmethod
+    def decode(cls, data):
+        """Reads a snapshot written by encode.
+
+        :param data: The snapshot file contents.
+        :type data: bytes
+
+        :return: The snapshot.
+        :rtype: ElectionSnapshot
+
+        :raises ValueError: If the data is not a snapshot of a known version.
+        """
+        sections = read_sections(memoryview(data))
+        meta = json.loads(bytes(sections[b"META"]))
+        return cls(
+            candidates=[tuple(candidate) for candidate in meta["candidates"]],
+            voter_index=SortedStrings.decode(sections[b"VOTR"]),
+            voted=SortedStrings.decode(sections[b"VOTD"]),
+            tallies=meta["tallies"],
+            covered=meta["covered"],
+            archive_bytes=meta["archive_bytes"],
+        )
+
+    def write(self, directory='.'):
+        """Atomically replaces the snapshot file.
+
+        :param directory: Directory holding the election files.
+        :type directory: str
+        """
+        path = os.path.join(directory, SNAPSHOT_FILE)
+        with open(path + ".tmp", 'wb') as file:
+            file.write(self.encode())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, directory='.'):
+        """Reads the snapshot file with a single read.
+
+        :param directory: Directory holding the election files.
+        :type directory: str
+
+        :return: The snapshot, or None if there is none.
+        :rtype: ElectionSnapshot
+        """
+        try:
+            with open(os.path.join(directory, SNAPSHOT_FILE), 'rb') as file:
+                return cls.decode(file.read())
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def import_files(cls, directory='.'):
+        """Builds a snapshot from the CSV and JSON files.
+
+        :param directory: Directory holding the election files.
+        :type directory: str
+
+        :return: The snapshot.
+        :rtype: ElectionSnapshot
+        """
+        # an impossible archive size makes refresh_votes count everything
+        snapshot = cls(candidates=read_candidates_csv(directory), archive_bytes=-1)
+        return snapshot.with_voters(read_voters_csv(directory)).refresh_votes(directory)
+
+    @classmethod
+    def open(cls, directory='.'):
+        """Loads the snapshot, importing and writing one if there is none.
+
+        :param directory: Directory holding the election files.
+        :type directory: str
+
+        :return: The snapshot.
+        :rtype: ElectionSnapshot
+        """
+        snapshot = cls.load(directory)
+        if snapshot is None:
+            snapshot = cls.import_files(directory)
+            snapshot.write(directory)
+        return snapshot
+
+    def checkpoint(self, directory='.'):
+        """Refreshes votes, writes the snapshot and exports the CSV files.
+
+        :param directory: Directory holding the election files.
+        :type directory: str
+        """
+        self.refresh_votes(directory)
+        self.write(directory)
+        write_candidates_csv(directory, self.candidates)
+        write_voters_csv(directory, self.voters())
+
+def read_candidates_csv(directory='.'):
+    """Imports the candidate registry from candidates.csv.
+
+    :param directory: Directory holding the election files.
+    :type directory: str
+
+    :return: (name, position) pairs in file order.
+    :rtype: list
+    """
+    try:
+        with open(os.path.join(directory, 'candidates.csv'), 'r', newline='') as file:
+            return [(row['Name'], row['Position']) for row in csv.DictReader(file)]
+    except FileNotFoundError:
+        return []
+
+def write_candidates_csv(directory, candidates):
+    """Exports the candidate registry to candidates.csv.
+
+    :param directory: Directory holding the election files.
+    :type directory: str
+
+    :param candidates: (name, position) pairs.
+    :type candidates: list
+    """
+    with open(os.path.join(directory, 'candidates.csv'), 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["Name", "Position"])
+        writer.writerows(candidates)
+
+def read_voters_csv(directory='.'):
+    """Imports the voter roll from voters.csv.
+
+    :param directory: Directory holding the election files.
+    :type directory: str
+
+    :return: (name, voter_id) pairs in file order.
+    :rtype: list
+    """
+    try:
+        with open(os.path.join(directory, 'voters.csv'), 'r', newline='') as file:
+            reader = csv.reader(file)
+            next(reader, None)
+            return [(row[0], row[1]) for row in reader if len(row) >= 2]
+    except FileNotFoundError:
+        return []
+
+def write_voters_csv(directory, voters):
+    """Exports the voter roll to voters.csv.
+
+    :param directory: Directory holding the election files.
+    :type directory: str
+
+    :param voters: (name, voter_id) pairs.
+    :type voters: list
+    """
+    with open(os.path.join(directory, 'voters.csv'), 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Name', 'VoterID'])
+        writer.writerows(voters)
+
+if __name__ == "__main__":
+    # re-import the CSV and JSON files: python snapshot.py [directory]
+    directory = sys.argv[1] if len(sys.argv) > 1 else '.'
+    snapshot = ElectionSnapshot.import_files(directory)
+    snapshot.write(directory)
+    print(f"Wrote {os.path.join(directory, SNAPSHOT_FILE)}")
@@ -0,0 +1,230 @@
+import os
+import time
+from ballot_store import ARCHIVE_LOG, iter_shard_tails, load_archive_state, read_ballots
+
+class RollingCounter:
+    """Event counts over a trailing time window held in a ring buffer.
+
+    Each slot stores the cumulative count up to the end of its bucket, so the
+    count for any trailing span is the difference of two slots and does not
+    depend on how many events were recorded.
+    """
+
+    def __init__(self, window_minutes=1440, bucket_seconds=60):
+        """Initializes a RollingCounter.
+
+        :param window_minutes: Number of buckets kept in the ring.
+        :type window_minutes: int
+
+        :param bucket_seconds: Width of one bucket in seconds.
+        :type bucket_seconds: int
+        """
+        self.size = window_minutes + 1
+        self.bucket_seconds = bucket_seconds
+        self.cumulative = [0] * self.size
+        self.head = None
+        self.total = 0
+
+    def _advance(self, bucket):
+        """Moves the newest slot forward to the given bucket.
+
+        :param bucket: The bucket number to advance to.
+        :type bucket: int
+        """
+        if self.head is None:
+            self.head = bucket
+        elif bucket > self.head:
+            steps = min(bucket - self.head, self.size)
+            for b in range(bucket - steps + 1, bucket + 1):
+                self.cumulative[b % self.size] = self.total
+            self.head = bucket
+        self.cumulative[self.head % self.size] = self.total
+
+    def add(self, timestamp, count=1):
+        """Records events at a point in time.
+
+        Events older than the window are dropped.
+
+        :param timestamp: Seconds since the epoch.
+        :type timestamp: float
+
+        :param count: Number of events.
+        :type count: int
+        """
+        bucket = int(timestamp // self.bucket_seconds)
+        self._advance(bucket)
+        if bucket <= self.head - self.size:
+            return
+        self.total += count
+        # late events also shift every newer slot
+        for b in range(bucket, self.head + 1):
+            self.cumulative[b % self.size] += count
+
+    def count(self, minutes, now=None):
+        """Number of events in the trailing span ending now.
+
+        :param minutes: Length of the span in buckets, capped to the window.
+        :type minutes: int
+
+        :param now: Seconds since the epoch, defaults to the current time.
+        :type now: float
+
+        :return: The event count.
+        :rtype: int
+        """
+        if self.head is None:
+            return 0
+        self._advance(int((time.time() if now is None else now) // self.bucket_seconds))
+        minutes = min(minutes, self.size - 1)
+        return self.cumulative[self.head % self.size] - self.cumulative[(self.head - minutes) % self.size]
+
+    def rate(self, minutes, now=None):
+        """Average events per bucket over the trailing span.
+
+        :param minutes: Length of the span in buckets.
+        :type minutes: int
+
+        :param now: Seconds since the epoch, defaults to the current time.
+        :type now: float
+
+        :return: Events per bucket.
+        :rtype: float
+        """
+        minutes = min(minutes, self.size - 1)
+        return self.count(minutes, now) / minutes if minutes else 0.0
+
+    def series(self, minutes, now=None):
+        """Per-bucket counts for the trailing span, oldest first.
+
+        :param minutes: Number of buckets to return, capped to the window.
+        :type minutes: int
+
+        :param now: Seconds since the epoch, defaults to the current time.
+        :type now: float
+
+        :return: A list of counts.
+        :rtype: list
+        """
+        if self.head is None:
+            return [0] * minutes
+        self._advance(int((time.time() if now is None else now) // self.bucket_seconds))
+        minutes = min(minutes, self.size - 1)
+        slots = [self.cumulative[b % self.size] for b in range(self.head - minutes, self.head + 1)]
+        return [newer - older for older, newer in zip(slots, slots[1:])]
+
+class TurnoutAggregator:
+    """Rolling turnout per kiosk and per position.
+
+    Kept up to date with refresh, which reads only the ballots appended to
+    each shard since the last refresh.
+    """
+
+    def __init__(self, window_minutes=1440, bucket_seconds=60):
+        """Initializes a TurnoutAggregator.
+
+        :param window_minutes: Number of buckets kept per counter.
+        :type window_minutes: int
+
+        :param bucket_seconds: Width of one bucket in seconds.
+        :type bucket_seconds: int
+        """
+        self.window_minutes = window_minutes
+        self.bucket_seconds = bucket_seconds
+        self.reset()
+
+    def reset(self):
+        """Forgets every recorded ballot and read offset."""
+        self.total = self.new_counter()
+        self.by_kiosk = {}
+        self.by_position = {}
+        self.covered = {}
+        self.archive_bytes = None
+
+    def new_counter(self):
+        """Creates an empty counter with this aggregator's window.
+
+        :return: A new RollingCounter.
+        :rtype: RollingCounter
+        """
+        return RollingCounter(self.window_minutes, self.bucket_seconds)
+
+    def record(self, ballot):
+        """Adds a committed ballot to the counters.
+
+        :param ballot: A ballot record as written by BallotStore.
+        :type ballot: dict
+        """
+        timestamp = ballot["ts"]
+        self.total.add(timestamp)
+        kiosk = ballot.get("kiosk", "")
+        if kiosk not in self.by_kiosk:
+            self.by_kiosk[kiosk] = self.new_counter()
+        self.by_kiosk[kiosk].add(timestamp)
+        for position in ballot["choices"]:
+            if position not in self.by_position:
+                self.by_position[position] = self.new_counter()
+            self.by_position[position].add(timestamp)
+
+    def refresh(self, directory='.'):
+        """Records the ballots committed since the last refresh.
+
+        Only shard tails past the offsets already read are parsed. Once
+        shards were folded into the archive the archive and shards are read
+        again from the start, because the archive then overlaps them.
+
+        :param directory: Directory holding the ballot shards.
+        :type directory: str
+
+        :return: Number of ballots recorded.
+        :rtype: int
+        """
+        recorded = 0
+        archive_bytes = load_archive_state(directory)["archive_bytes"]
+        if archive_bytes != self.archive_bytes:
+            self.reset()
+            self.archive_bytes = archive_bytes
+            for ballot in read_ballots(os.path.join(directory, ARCHIVE_LOG)):
+                self.record(ballot)
+                recorded += 1
+        for ballot in iter_shard_tails(directory, self.covered):
+            self.record(ballot)
+            recorded += 1
+        return recorded
+
+    def counter(self, kiosk=None, position=None):
+        """Counter for one kiosk, one position, or all ballots.
+
+        :param kiosk: Kiosk ID to select.
+        :type kiosk: str
+
+        :param position: Position to select.
+        :type position: str
+
+        :return: The matching counter, or an empty one if nothing was recorded.
+        :rtype: RollingCounter
+        """
+        if kiosk is not None:
+            return self.by_kiosk.get(kiosk) or self.new_counter()
+        if position is not None:
+            return self.by_position.get(position) or self.new_counter()
+        return self.total
+
+    def rate(self, minutes=10, kiosk=None, position=None, now=None):
+        """Ballots per minute over the trailing span.
+
+        :param minutes: Length of the span.
+        :type minutes: int
+
+        :param kiosk: Kiosk ID to select.
+        :type kiosk: str
+
+        :param position: Position to select.
+        :type position: str
+
+        :param now: Seconds since the epoch, defaults to the current time.
+        :type now: float
+
+        :return: Ballots per bucket.
+        :rtype: float
+        """
+        return self.counter(kiosk, position).rate(minutes, now)
@@ -1,19 +1,29 @@
 import tkinter as tk
 from tkinter import messagebox
-import csv
-import json
+from candidate_search import CandidateIndex, show_matches
+from election_host import ElectionPartition
+from snapshot import read_candidates_csv
 
 class VoterApp(tk.Tk):
     """The main voter interface"""
+
+    # tries to commit a ballot before reporting the failure to the voter
+    SAVE_ATTEMPTS = 3
     
-    def __init__(self, voter_user):
+    def __init__(self, voter_user=None, kiosk_id=None, directory='.', partition=None):
         """Initialize the VoterApp.
 
-        :param voter_user: An object representing the voter user.
+        :param voter_user: An object representing the voter user, or None to
+            build the ballot without starting a session.
+        :param kiosk_id: ID recorded on ballots cast here, defaults to the host name.
+        :param directory: Directory holding the election files.
+        :param partition: Already loaded election to show, instead of loading
+            the one in directory.
         """
         super().__init__()
-        self.voter_user = voter_user
-        self.title(f"Voter {self.voter_user.login_id}")
+        self.voter_user = None
+        self.partition = None
+        self.submission_id = None
 
         width = 900
         height = 600
@@ -24,53 +34,111 @@ class VoterApp(tk.Tk):
 
         self.geometry(f"{width}x{height}+{x}+{y}")
 
-        # listbox frame
-        frame = tk.Frame(self)
-        frame.pack(expand=True, padx=20, pady=20)
+        # ballot frame
+        self.ballot_frame = tk.Frame(self)
+        self.ballot_frame.pack(expand=True, fill=tk.BOTH)
+
+        # listbox frame, filled per election
+        self.listbox_frame = tk.Frame(self.ballot_frame)
+        self.listbox_frame.pack(expand=True, padx=20, pady=20)
         self.candidates_listboxes = {}
-        categories = ["President", "Vice-President", "Secretary", "Treasurer"]
-        for category in categories:
-            label = tk.Label(frame, text=f"{category} Candidates:")
-            label.grid(row=categories.index(category), column=0, sticky="w", pady=(0, 10))
-            listbox = tk.Listbox(frame, selectmode=tk.SINGLE, exportselection=False, width=40, height=5)
-            listbox.grid(row=categories.index(category), column=1, padx=(10, 0), pady=(0, 10), sticky="w")
-            scrollbar = tk.Scrollbar(frame, orient=tk.VERTICAL, command=listbox.yview)
-            scrollbar.grid(row=categories.index(category), column=2, sticky="ns", pady=(0, 10))
-            listbox.config(yscrollcommand=scrollbar.set)
-            self.candidates_listboxes[category] = listbox
-        self.load_candidates()
+        self.search_entries = {}
+        self.shown_candidates = {}
+        self.candidate_index = CandidateIndex()
 
         # vote
-        self.vote_button = tk.Button(self, text="Vote", command=self.submit_vote)
+        self.vote_button = tk.Button(self.ballot_frame, text="Vote", command=self.submit_vote)
         self.vote_button.pack(pady=(0, 10))
 
         # Status Label
-        self.status_label = tk.Label(self, text="", fg="green")
+        self.status_label = tk.Label(self.ballot_frame, text="", fg="green")
         self.status_label.pack()
 
-        # bind and clear
-        for listbox in self.candidates_listboxes.values():
+        self.open_election(partition or ElectionPartition(directory, kiosk_id))
+
+        if voter_user is not None:
+            self.start_session(voter_user)
+
+    def destroy(self):
+        """Close this kiosk's ballot shard and the window."""
+        self.partition.close()
+        super().destroy()
+
+    def open_election(self, partition):
+        """Build the ballot for an election.
+
+        :param partition: The election's loaded state.
+        """
+        self.partition = partition
+        for widget in self.listbox_frame.winfo_children():
+            widget.destroy()
+        self.candidates_listboxes = {}
+        self.search_entries = {}
+        self.shown_candidates = {}
+        for row, category in enumerate(partition.positions):
+            header = tk.Frame(self.listbox_frame)
+            header.grid(row=row, column=0, sticky="nw", pady=(0, 10))
+            label = tk.Label(header, text=f"{category} Candidates:")
+            label.pack(anchor="w")
+            search_entry = tk.Entry(header, width=20)
+            search_entry.pack(anchor="w")
+            search_entry.bind("<KeyRelease>", lambda event, category=category: self.filter_candidates(category))
+            self.search_entries[category] = search_entry
+            listbox = tk.Listbox(self.listbox_frame, selectmode=tk.SINGLE, exportselection=False, width=40, height=5)
+            listbox.grid(row=row, column=1, padx=(10, 0), pady=(0, 10), sticky="w")
+            scrollbar = tk.Scrollbar(self.listbox_frame, orient=tk.VERTICAL, command=listbox.yview)
+            scrollbar.grid(row=row, column=2, sticky="ns", pady=(0, 10))
+            listbox.config(yscrollcommand=scrollbar.set)
+            self.candidates_listboxes[category] = listbox
+            self.shown_candidates[category] = []
+
+            # bind and clear
             listbox.bind("<FocusIn>", lambda event, category=category: self.clear_status(event, category))
 
-        # bind and update vote button
-        for listbox in self.candidates_listboxes.values():
+            # bind and update vote button
             listbox.bind("<<ListboxSelect>>", self.on_category_select)
+        self.load_candidates()
+
+    def start_session(self, voter_user):
+        """Start a voting session on the already built ballot.
+
+        :param voter_user: An object representing the voter user.
+        """
+        self.voter_user = voter_user
+        self.submission_id = self.partition.ballot_store.new_submission_id()
+        self.title(f"Voter {self.voter_user.login_id}")
+        self.reset_ballot()
+
+    def reset_ballot(self):
+        """Clear selections and status so the ballot is ready for the next voter."""
+        for category, listbox in self.candidates_listboxes.items():
+            self.search_entries[category].delete(0, tk.END)
+            self.filter_candidates(category)
+            listbox.selection_clear(0, tk.END)
+            listbox.yview_moveto(0)
+        self.vote_button.config(state=tk.NORMAL)
+        self.status_label.config(text="")
 
     def load_candidates(self):
-        """Load candidates from the CSV file to the listboxes."""
-        for listbox in self.candidates_listboxes.values():
-            listbox.delete(0, tk.END)
-        try:
-            with open('candidates.csv', 'r') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    name = row['Name']
-                    position = row['Position']
-                    if position in self.candidates_listboxes:
-                         self.candidates_listboxes[position].insert(tk.END, name)
-        except FileNotFoundError:
-            pass
-                   
+        """Load candidates from the election snapshot, or the CSV file if
+        there is no snapshot yet, to the listboxes."""
+        self.candidate_index = CandidateIndex()
+        snapshot = self.partition.snapshot
+        candidates = snapshot.candidates if snapshot is not None else read_candidates_csv(self.partition.directory)
+        for name, position in candidates:
+            if position in self.candidates_listboxes:
+                self.candidate_index.add(position, name)
+        for category in self.candidates_listboxes:
+            self.filter_candidates(category)
+
+    def filter_candidates(self, category):
+        """Show only the candidates whose names start with the search text.
+
+        :param category: The category whose listbox is filtered.
+        """
+        show_matches(self.candidates_listboxes[category], self.shown_candidates[category],
+                     self.candidate_index, category, self.search_entries[category].get())
+
     def on_category_select(self, event):
         """Event handler when category is selected in listbox.
 
@@ -87,66 +155,62 @@ class VoterApp(tk.Tk):
 
             for category, listbox in self.candidates_listboxes.items():
                 selected_index = listbox.curselection()
-                if selected_index:
+                # the "more matches" row after the shown candidates is not a vote
+                if selected_index and selected_index[0] < len(self.shown_candidates[category]):
                     selected_candidates[category] = listbox.get(selected_index[0])
                 else:
                     self.display_status(f"Please select 1 candidate from each category.", "red")
                     return
 
+            if not self.save_vote(selected_candidates):
+                self.display_status("Your vote could not be saved, please press Vote again.", "red")
+                return
+
             message = "Vote submitted successfully!\nSelected Candidates:\n"
             message += "\n".join(f"{category}: {candidate}" for category, candidate in selected_candidates.items())
             self.display_status(message, "green")
-            self.save_vote(selected_candidates)
             self.mark_as_voted()
+            self.on_vote_submitted()
+
+    def on_vote_submitted(self):
+        """Hook called once the current voter's ballot has been recorded."""
+        pass
 
     def has_voted(self):
         """Check if the voter has already voted.
 
         :return: True if the voter has voted, False otherwise.
         """
+        if self.partition.snapshot is not None:
+            return self.partition.snapshot.has_voted(self.voter_user.login_id, self.partition.directory)
         try:
-            with open(f'voter_{self.voter_user.login_id}.txt', 'r') as file:
+            with open(self.partition.marker_path(self.voter_user.login_id), 'r') as file:
                 return file.read() == 'voted'
         except FileNotFoundError:
             return False
 
     def mark_as_voted(self):
-        """Mark voter as voted by creating a TXT file."""
-        with open(f'voter_{self.voter_user.login_id}.txt', 'w') as file:
+        """Mark voter as voted by creating a TXT file and journaling it for replicas."""
+        with open(self.partition.marker_path(self.voter_user.login_id), 'w') as file:
             file.write('voted')
+        self.partition.ballot_store.record_voted(self.voter_user.login_id)
 
     def save_vote(self, selected_candidates):
-        """Save selected candidate votes to the JSON file.
+        """Save selected candidate votes to this kiosk's ballot shard.
+
+        Every attempt carries the session's submission ID, so a retry after
+        a save that failed late is not counted twice.
 
         :param selected_candidates: A dictionary containing selected candidates for each position.
+        :return: True if the ballot is committed, False if every attempt failed.
         """
-        try:
-            if not self.has_headers('votes.json'):
-                headers = {"President": [], "Vice-President": [], "Secretary": [], "Treasurer": []}
-                with open('votes.json', 'w') as header_file:
-                    json.dump(headers, header_file)
-            with open('votes.json', 'r') as file:
-                votes_data = json.load(file)
-            for position, candidate in selected_candidates.items():
-                votes_data[position].append(candidate)
-            with open('votes.json', 'w') as file:
-                json.dump(votes_data, file)
-        except Exception as e:
-            print(f"Error saving vote: {e}")
-            
-    def has_headers(self, file_path):
-        """Check if CSV file has headers.
-
-        :param file_path: The path to the CSV file.
-        :return: True if the file has headers, False otherwise.
-        """
-        try:
-            with open(file_path, 'r', newline='') as file:
-                reader = csv.reader(file)
-                headers = next(reader, None)
-                return headers is not None
-        except FileNotFoundError:
-            return False
+        for attempt in range(self.SAVE_ATTEMPTS):
+            try:
+                self.partition.ballot_store.append(selected_candidates, self.submission_id)
+                return True
+            except OSError as e:
+                print(f"Error saving vote: {e}")
+        return False
 
     def display_status(self, message, color):
         """Display a status message in the GUI.
@@ -0,0 +1,299 @@
+import csv
+import math
+import mmap
+import os
+import struct
+from collections import Counter
+from snapshot import SNAPSHOT_FILE, ElectionSnapshot, SortedStrings, read_sections
+
+def snapshot_has_voter(data, key):
+    """Binary searches the voter section of a snapshot for a voter key.
+
+    Every view of data is released before returning, so the caller can
+    close the mapping.
+
+    :param data: The snapshot file contents.
+    :type data: mmap.mmap
+
+    :param key: The voter key from ElectionSnapshot.voter_key.
+    :type key: str
+
+    :return: True if the voter is registered, False if not.
+    :rtype: bool
+
+    :raises ValueError: If the data is not a snapshot of a known version,
+        or is corrupt.
+
+    :raises KeyError: If the snapshot has no voter section.
+    """
+    with memoryview(data) as view:
+        sections = read_sections(view)
+        try:
+            voters = SortedStrings.decode(sections[b"VOTR"])
+            try:
+                return key in voters
+            finally:
+                voters.release()
+        finally:
+            for section in sections.values():
+                section.release()
+
+class VoterRoll:
+    """Read access to the voter roll stored in the voters CSV file.
+
+    Lookups binary search the voter section of the election snapshot in
+    the same directory, memory-mapped, so nothing is parsed or held in
+    memory however big the roll is and voters saved by the admin app are
+    seen at once. The CSV is scanned instead when there is no snapshot.
+    """
+
+    def __init__(self, path='voters.csv'):
+        """Initializes a VoterRoll.
+
+        :param path: Path to the voters CSV file.
+        :type path: str
+        """
+        self.path = path
+
+    def verify_voter(self, name, voter_id):
+        """Verifies the voter credentials.
+
+        :param name: The voter's name.
+        :type name: str
+
+        :param voter_id: The voter's ID.
+        :type voter_id: str
+
+        :return: True if the credentials are valid, False if not.
+        :rtype: bool
+        """
+        found = self.search_snapshot(name, voter_id)
+        if found is not None:
+            return found
+        return self.scan_csv(name, voter_id)
+
+    def search_snapshot(self, name, voter_id):
+        """Looks the voter up in the snapshot's sorted voter section.
+
+        :param name: The voter's name.
+        :type name: str
+
+        :param voter_id: The voter's ID.
+        :type voter_id: str
+
+        :return: True or False, or None if there is no readable snapshot.
+        :rtype: bool
+        """
+        try:
+            with open(os.path.join(os.path.dirname(self.path), SNAPSHOT_FILE), 'rb') as file, \
+                    mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                try:
+                    return snapshot_has_voter(data, ElectionSnapshot.voter_key(name, voter_id))
+                except (ValueError, KeyError, struct.error):
+                    # truncated or corrupt, the CSV scan still works
+                    return None
+        except (FileNotFoundError, ValueError):
+            # ValueError from mapping an empty file
+            return None
+
+    def scan_csv(self, name, voter_id):
+        """Looks the voter up by reading the whole CSV file.
+
+        :param name: The voter's name.
+        :type name: str
+
+        :param voter_id: The voter's ID.
+        :type voter_id: str
+
+        :return: True if the credentials are valid, False if not.
+        :rtype: bool
+        """
+        try:
+            with open(self.path, newline="") as csvfile:
+                reader = csv.DictReader(csvfile)
+                for row in reader:
+                    if row["Name"] == name and row["VoterID"] == voter_id:
+                        return True
+        except FileNotFoundError:
+            pass
+        return False
+
+# names at least this similar are reported as probable duplicates
+DUPLICATE_THRESHOLD = 0.6
+
+# most posting list entries and candidate names one lookup reads, which
+# bounds its time on rolls of millions
+MAX_POSTINGS = 5000
+MAX_CHECKED = 100
+
+def normalize_name(name):
+    """Folds case, punctuation and spacing out of a name.
+
+    :param name: The name to normalize.
+    :type name: str
+
+    :return: The normalized name.
+    :rtype: str
+    """
+    return " ".join("".join(char if char.isalnum() else " " for char in name.casefold()).split())
+
+def name_grams(name):
+    """Character 4-grams of a normalized name, padded at both ends.
+
+    :param name: A normalized name.
+    :type name: str
+
+    :return: A set of 4-grams.
+    :rtype: set
+    """
+    padded = f" {name} "
+    return {padded[i:i + 4] for i in range(len(padded) - 3)}
+
+class NearDuplicateIndex:
+    """Character 4-gram inverted index that finds voters with similar names.
+
+    Only the rarest few 4-grams of each name are indexed. Two names whose
+    4-gram Jaccard similarity reaches the threshold always share one of
+    them, so a lookup reads a handful of short posting lists instead of
+    comparing against every name on the roll. Lookups read and compare a
+    bounded number of names, the ones sharing the most rare 4-grams first,
+    and say when they hit that bound, since a name made only of very common
+    4-grams may then miss a near duplicate; identical names are always
+    found.
+    """
+
+    def __init__(self, threshold=DUPLICATE_THRESHOLD, max_postings=MAX_POSTINGS, max_checked=MAX_CHECKED):
+        """Initializes an empty NearDuplicateIndex.
+
+        :param threshold: Lowest 4-gram Jaccard similarity reported.
+        :type threshold: float
+
+        :param max_postings: Most posting list entries one lookup reads.
+        :type max_postings: int
+
+        :param max_checked: Most names one lookup compares.
+        :type max_checked: int
+        """
+        self.threshold = threshold
+        self.max_postings = max_postings
+        self.max_checked = max_checked
+        self.voters = {}
+        self.postings = {}
+        self.gram_rank = {}
+
+    def build(self, voters):
+        """Indexes a whole roll, ranking 4-grams by how common they are.
+
+        :param voters: (name, voter_id) pairs.
+        :type voters: iterable
+        """
+        voters = list(voters)
+        frequency = {}
+        for name, _ in voters:
+            for gram in name_grams(normalize_name(name)):
+                frequency[gram] = frequency.get(gram, 0) + 1
+        self.voters = {}
+        self.postings = {}
+        self.gram_rank = frequency
+        for name, voter_id in voters:
+            self.add(name, voter_id)
+
+    def prefix_grams(self, grams):
+        """The rarest 4-grams of a name, enough that any name at least
+        threshold-similar shares one of them.
+
+        4-grams never seen by build rank as rarest.
+
+        :param grams: The name's 4-grams.
+        :type grams: set
+
+        :return: A list of 4-grams.
+        :rtype: list
+        """
+        ordered = sorted(grams, key=lambda gram: (self.gram_rank.get(gram, 0), gram))
+        return ordered[:len(ordered) - math.ceil(self.threshold * len(ordered)) + 1]
+
+    def add(self, name, voter_id):
+        """Adds a voter to the index.
+
+        :param name: The voter's name.
+        :type name: str
+
+        :param voter_id: The voter's ID.
+        :type voter_id: str
+        """
+        key = normalize_name(name)
+        if key not in self.voters:
+            self.voters[key] = []
+            for gram in self.prefix_grams(name_grams(key)):
+                self.postings.setdefault(gram, []).append(key)
+        self.voters[key].append((name, voter_id))
+
+    def remove(self, name, voter_id):
+        """Removes a voter from the index.
+
+        :param name: The voter's name.
+        :type name: str
+
+        :param voter_id: The voter's ID.
+        :type voter_id: str
+        """
+        key = normalize_name(name)
+        voters = self.voters.get(key)
+        if not voters or (name, voter_id) not in voters:
+            return
+        voters.remove((name, voter_id))
+        if not voters:
+            del self.voters[key]
+            for gram in self.prefix_grams(name_grams(key)):
+                self.postings[gram].remove(key)
+
+    def find(self, name, limit=5):
+        """Voters whose names are probably the same person as a name.
+
+        :param name: The name to look up.
+        :type name: str
+
+        :param limit: Most voters to return.
+        :type limit: int
+
+        :return: A list of (similarity, name, voter_id) tuples, most similar
+            first, and False if the lookup hit max_postings or max_checked,
+            so names it did not compare may be near duplicates too.
+        :rtype: tuple
+        """
+        key = normalize_name(name)
+        if not key:
+            return [], True
+        grams = name_grams(key)
+        complete = True
+        # rarest posting lists first, the one that passes the cap only in part
+        hits = Counter()
+        read = 0
+        for gram in self.prefix_grams(grams):
+            posting = self.postings.get(gram, ())
+            if read + len(posting) > self.max_postings:
+                hits.update(posting[:self.max_postings - read])
+                complete = False
+                break
+            read += len(posting)
+            hits.update(posting)
+        hits.pop(key, None)
+        matches = [(1.0, voter_name, voter_id) for voter_name, voter_id in self.voters.get(key, ())]
+        # a name of n characters has at most n - 1 distinct 4-grams
+        min_length = self.threshold * len(grams) + 1
+        checked = 0
+        for candidate, _ in hits.most_common():
+            if len(candidate) < min_length:
+                continue
+            if checked == self.max_checked:
+                complete = False
+                break
+            checked += 1
+            candidate_grams = name_grams(candidate)
+            shared = len(grams & candidate_grams)
+            similarity = shared / (len(grams) + len(candidate_grams) - shared)
+            if similarity >= self.threshold:
+                matches.extend((similarity, voter_name, voter_id) for voter_name, voter_id in self.voters[candidate])
+        matches.sort(key=lambda match: -match[0])
+        return matches[:limit], complete